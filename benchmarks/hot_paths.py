@@ -0,0 +1,341 @@
+"""micro-benchmarks for the local hot paths of membership checks.
+
+run from the repository root:
+
+    python -m benchmarks.hot_paths
+    python -m benchmarks.hot_paths --sizes 1000,1000000 --mixes steady
+    python -m benchmarks.hot_paths --update-baseline
+
+results are written as json and compared against `benchmarks/baseline.json`,
+exiting with status 1 if any case got slower or allocates more than the
+tolerance allows. timings depend on the machine, so refresh the baseline
+on the machine you compare on before relying on it."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable
+
+from src.commands.membership import _classify, _diff_members
+from src.utils.csv_utils import (
+    get_existing_members_from_csv,
+    update_members_csv,
+)
+from src.utils.external import external_diff
+from src.utils.functions import get_player_id_map, get_username_map
+from src.utils.journal import CLOSED, LEFT
+from src.utils.structures import Member, MemberRecords
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+CLUB_NAME = "benchmark-club"
+# differences smaller than these are noise, whatever the tolerance
+NOISE_FLOORS = {"seconds": 0.001, "peak_bytes": 4096}
+
+# share of the club affected by each kind of change in one run
+MIXES: dict[str, dict[str, float]] = {
+    "steady": {"left": 0.01, "closed": 0.002, "joined": 0.01},
+    "growth": {"left": 0.005, "joined": 0.05, "returned": 0.01},
+    "exodus": {"left": 0.05, "closed": 0.01, "joined": 0.002},
+    "renames": {"renamed": 0.02, "returned": 0.01, "reopened": 0.005},
+}
+
+
+@dataclass
+class _Fixture:
+    members: list[Member]
+    incoming: list[Member]
+    closed: set[int] = field(default_factory=set)
+
+    def record(self) -> MemberRecords:
+        return MemberRecords(replace(member) for member in self.members)
+
+
+def _username(rng: random.Random) -> str:
+    return f"{rng.getrandbits(48):012x}"
+
+
+def make_fixture(size: int, mix: str, seed: int = 0) -> _Fixture:
+    """`size` current members plus a tenth as many former ones,
+    and the member list the api would return after churn of `mix`"""
+
+    rng = random.Random(seed)
+    rates = MIXES[mix]
+    members = [
+        Member(_username(rng), 1_000_000 + i, 1_500_000_000 + i, True)
+        for i in range(size)
+    ]
+    former = [
+        Member(_username(rng), 2_000_000 + i, 1_400_000_000 + i, False)
+        for i in range(size // 10)
+    ]
+    current = [replace(member) for member in members]
+    rng.shuffle(current)
+
+    def take(rate: float) -> list[Member]:
+        count = min(int(size * rate), len(current))
+        taken = current[:count]
+        del current[:count]
+        return taken
+
+    left = take(rates.get("left", 0))
+    closed = take(rates.get("closed", 0))
+    renamed = take(rates.get("renamed", 0))
+    for member in renamed:
+        member.username = _username(rng)
+    joined = [
+        Member(_username(rng), 3_000_000 + i, 1_600_000_000 + i, True)
+        for i in range(int(size * rates.get("joined", 0)))
+    ]
+    returned = [
+        replace(member, joined=1_600_000_000 + i, is_active=True)
+        for i, member in enumerate(
+            former[: int(size * rates.get("returned", 0))]
+        )
+    ]
+    reopened_start = len(returned)
+    reopened_end = reopened_start + int(size * rates.get("reopened", 0))
+    reopened = [
+        replace(member, is_active=True)
+        for member in former[reopened_start:reopened_end]
+    ]
+    incoming = current + renamed + joined + returned + reopened
+    rng.shuffle(incoming)
+    return _Fixture(
+        members + former,
+        incoming,
+        {member.player_id for member in closed if member.player_id},
+    )
+
+
+# cases take a fixture and return a setup function, whose result is
+# passed to the timed function
+
+
+def _records_init(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (lambda: fixture.members, MemberRecords)
+
+
+def _records_update(fixture: _Fixture) -> tuple[Callable, Callable]:
+    batch = fixture.members[: max(len(fixture.members) // 100, 1)]
+
+    def setup() -> tuple[MemberRecords, list[Member]]:
+        return fixture.record(), [replace(member) for member in batch]
+
+    return (setup, lambda state: state[0].update(state[1], False))
+
+
+def _records_all(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (fixture.record, lambda record: record.all)
+
+
+def _sort_members(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (lambda: fixture.incoming, sorted)
+
+
+def _username_map(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (lambda: fixture.incoming, get_username_map)
+
+
+def _player_id_map(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (lambda: fixture.incoming, get_player_id_map)
+
+
+def _diff(fixture: _Fixture) -> tuple[Callable, Callable]:
+    def setup() -> tuple[list[Member], list[Member]]:
+        return list(fixture.record().current.values()), fixture.incoming
+
+    return (setup, lambda state: _diff_members(*state))
+
+
+def _external_diff(fixture: _Fixture) -> tuple[Callable, Callable]:
+    def run(state: tuple[list[Member], list[Member]]) -> None:
+        with tempfile.TemporaryDirectory() as dir:
+            external_diff(*state, dir)
+
+    return (_diff(fixture)[0], run)
+
+
+def _classify_state(fixture: _Fixture) -> tuple[MemberRecords, tuple]:
+    record = fixture.record()
+    incoming = [replace(member) for member in fixture.incoming]
+    additions, deletions = _diff_members(record.current.values(), incoming)
+    return record, (
+        get_player_id_map(additions),
+        get_player_id_map(deletions),
+        record.archive,
+        lambda member: CLOSED if member.player_id in fixture.closed else LEFT,
+    )
+
+
+def _classify_changes(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (
+        lambda: _classify_state(fixture)[1],
+        lambda state: _classify(*state),
+    )
+
+
+def _summarise(fixture: _Fixture) -> tuple[Callable, Callable]:
+    def setup() -> tuple:
+        record, state = _classify_state(fixture)
+        return _classify(*state), record
+
+    def run(state: tuple) -> None:
+        change_manager, record = state
+        with contextlib.redirect_stdout(io.StringIO()):
+            change_manager.summarise(record)
+
+    return (setup, run)
+
+
+def _csv_save(fixture: _Fixture) -> tuple[Callable, Callable]:
+    return (
+        fixture.record,
+        lambda record: update_members_csv(CLUB_NAME, record),
+    )
+
+
+def _csv_load(fixture: _Fixture) -> tuple[Callable, Callable]:
+    def setup() -> str:
+        update_members_csv(CLUB_NAME, fixture.record())
+        return CLUB_NAME
+
+    return (setup, get_existing_members_from_csv)
+
+
+# cases that depend on the churn mix are run for every mix
+CASES: dict[str, tuple[Callable, bool]] = {
+    "records_init": (_records_init, False),
+    "records_update": (_records_update, False),
+    "records_all": (_records_all, False),
+    "sort_members": (_sort_members, False),
+    "username_map": (_username_map, False),
+    "player_id_map": (_player_id_map, False),
+    "diff": (_diff, True),
+    "external_diff": (_external_diff, True),
+    "classify": (_classify_changes, True),
+    "summarise": (_summarise, True),
+    "csv_save": (_csv_save, False),
+    "csv_load": (_csv_load, False),
+}
+
+
+def _measure(setup: Callable, run: Callable, repeat: int) -> dict[str, Any]:
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - start)
+    state = setup()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": max(peak, 0)}
+
+
+def run_benchmarks(
+    sizes: list[int], mixes: list[str], repeat: int
+) -> dict[str, dict[str, Any]]:
+    results: dict[str, dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        # csv paths are relative to the working directory
+        os.chdir(tmp)
+        try:
+            for size in sizes:
+                fixtures = {mix: make_fixture(size, mix) for mix in mixes}
+                for name, (case, by_mix) in CASES.items():
+                    for mix in mixes if by_mix else mixes[:1]:
+                        key = f"{name}[{size}" + (
+                            f",{mix}]" if by_mix else "]"
+                        )
+                        setup, run = case(fixtures[mix])
+                        results[key] = _measure(setup, run, repeat)
+                        print(
+                            f"{key}: {results[key]['seconds'] * 1000:.2f} ms,"
+                            f" {results[key]['peak_bytes'] / 1024:.0f} KiB",
+                            file=sys.stderr,
+                        )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def find_regressions(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    tolerance: float,
+) -> list[str]:
+    """cases slower or allocating more than `tolerance` over the baseline"""
+
+    regressions: list[str] = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            old, new = baseline[key][metric], result[metric]
+            if new - old < NOISE_FLOORS[metric]:
+                continue
+            if old and new > old * (1 + tolerance):
+                regressions.append(
+                    f"{key} {metric}: {old:.6g} -> {new:.6g}"
+                    f" (+{new / old - 1:.0%})"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in DEFAULT_SIZES)
+    )
+    parser.add_argument("--mixes", default=",".join(MIXES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    mixes = args.mixes.split(",")
+    results = run_benchmarks(sizes, mixes, args.repeat)
+    with open(args.output, "w") as stream:
+        json.dump(results, stream, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}")
+        return
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print(f"regressions ({len(regressions)}):")
+        print(*regressions, sep="\n")
+        raise SystemExit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
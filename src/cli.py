@@ -1,6 +1,7 @@
 import click
 
 from .commands.config import config
+from .commands.matches import matches
 from .commands.membership import membership
 from .commands.recruitment import recruitment
 
@@ -13,6 +14,7 @@ def cli():
 cli.add_command(membership)
 cli.add_command(recruitment)
 cli.add_command(config)
+cli.add_command(matches)
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,479 @@
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import click
+import requests
+
+from ..utils.budget import BudgetExceeded, log_session, start_session
+from ..utils.functions import (
+    get_member_records,
+    get_stats_cache,
+    map_concurrently,
+    updated_stats_cache,
+)
+from ..utils.indexes import RatingIndex
+from ..utils.structures import (
+    Board,
+    Club,
+    Configs,
+    Match,
+    Member,
+    StatsCache,
+    _MatchTeam,
+    _PlayerStats,
+)
+from .membership import _get_club_names
+
+
+def _refresh_stats(
+    session: requests.Session,
+    usernames: Iterable[str],
+    cache: StatsCache,
+    max_age: int,
+    workers: int = 1,
+) -> None:
+    """fetches stats of players whose cached stats are missing or stale"""
+
+    stale = {
+        username.lower()
+        for username in usernames
+        if cache.get(username, max_age) is None
+    }
+    if stale:
+        print(f"fetching stats of {len(stale)} player(s)")
+    try:
+        for username, future in map_concurrently(
+            lambda username: Member(username=username).get_stats(session),
+            stale,
+            workers,
+        ):
+            try:
+                cache.set(username, future.result())
+            except requests.exceptions.HTTPError:
+                # account closed or renamed since we last saw it
+                continue
+    finally:
+        updated_stats_cache(cache)
+
+
+def _get_team(match: Match, club: Club) -> Optional[_MatchTeam]:
+    for team in (match.teams.team1, match.teams.team2):
+        if team.api == club.api:
+            return team
+    return None
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option("--refresh", "-r", is_flag=True, default=False)
+@click.option("--workers", "-w", type=int, default=8)
+@click.option("--max-requests", "-m", type=int)
+def eligible(
+    club_name: Optional[str] = None,
+    refresh: bool = False,
+    workers: int = 8,
+    max_requests: Optional[int] = None,
+) -> None:
+    """lists members who can join open matches but haven't"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    max_age = configs.cache.stats_expiry * 3600
+    session = start_session(configs, max_requests, workers)
+    try:
+        club = Club.from_str(session, club_name)
+        registered = club.get_matches(session).registered
+        if not registered:
+            print(f"no open matches for {club_name}")
+            return
+
+        members = get_member_records(club_name).current.values()
+        usernames = [member.username.lower() for member in members]
+        cache = get_stats_cache()
+        if refresh:
+            try:
+                _refresh_stats(session, usernames, cache, max_age, workers)
+            except BudgetExceeded as e:
+                # list candidates from whatever stats we have
+                print(e)
+        fresh = cache.fresh(max_age)
+        missing = sum(username not in fresh for username in usernames)
+        if missing:
+            print(
+                f"no fresh stats for {missing} member(s)"
+                + ("" if refresh else " - use `--refresh` to fetch them")
+            )
+        index = RatingIndex(
+            {
+                username: fresh[username]
+                for username in usernames
+                if username in fresh
+            }
+        )
+
+        for club_match in registered:
+            match = Match.from_str(session, club_match.api)
+            team = _get_team(match, club)
+            joined = (
+                {player.username.lower() for player in team.players}
+                if team
+                else set()
+            )
+            candidates = [
+                username
+                for username in index.eligible(match.settings)
+                if username not in joined
+            ]
+            print(f"{match.name} ({len(candidates)}): {match.url}")
+            for username in reversed(candidates):
+                print(username, f"https://www.chess.com/member/{username}")
+    except BudgetExceeded as e:
+        print(e)
+    finally:
+        log_session(session, club_name, "matches")
+
+
+# how often boards with ongoing games are revalidated, unchanged boards
+# are checked less and less often up to the maximum
+_MIN_BOARD_INTERVAL = 300
+_MAX_BOARD_INTERVAL = 6 * 3600
+_DRAWS = {
+    "agreed",
+    "repetition",
+    "stalemate",
+    "insufficient",
+    "50move",
+    "timevsinsufficient",
+}
+
+
+def _result_score(result: Optional[str]) -> float:
+    if result == "win":
+        return 1.0
+    return 0.5 if result in _DRAWS else 0.0
+
+
+def _expected_score(rating: Optional[int], opponent: Optional[int]) -> float:
+    if rating is None or opponent is None:
+        return 0.5
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+@dataclass
+class _BoardState:
+    api: str
+    etag: Optional[str] = None
+    score: float = 0.0
+    opponent_score: float = 0.0
+    expected: float = 0.0
+    opponent_expected: float = 0.0
+    finished: bool = False
+    interval: int = _MIN_BOARD_INTERVAL
+    next_poll: int = 0
+
+
+class _MatchTracker:
+    """live score of a match, kept up to date by revalidating only boards
+    that still have games going on"""
+
+    def __init__(self, match: Match, team: _MatchTeam) -> None:
+        self.match = match
+        self.usernames = {player.username.lower() for player in team.players}
+        self.boards: dict[str, _BoardState] = {}
+        self.score = self.opponent_score = 0.0
+        self.projected = self.opponent_projected = 0.0
+        for player in team.players:
+            board = _BoardState(player.board)
+            if player.played_as_white and player.played_as_black:
+                # both games are over, so the match page has the result
+                board.score = _result_score(
+                    player.played_as_white
+                ) + _result_score(player.played_as_black)
+                board.opponent_score = 2 - board.score
+                board.finished = True
+            self.boards[board.api] = board
+            self._add(board, 1)
+
+    def _add(self, board: _BoardState, sign: int) -> None:
+        self.score += sign * board.score
+        self.opponent_score += sign * board.opponent_score
+        self.projected += sign * (board.score + board.expected)
+        self.opponent_projected += sign * (
+            board.opponent_score + board.opponent_expected
+        )
+
+    def due(self, now: int) -> list[_BoardState]:
+        return [
+            board
+            for board in self.boards.values()
+            if not board.finished and board.next_poll <= now
+        ]
+
+    @property
+    def next_poll(self) -> Optional[int]:
+        polls = [
+            board.next_poll
+            for board in self.boards.values()
+            if not board.finished
+        ]
+        return min(polls) if polls else None
+
+    def update(
+        self, board: _BoardState, data: Optional[Board], now: int
+    ) -> None:
+        if data is None:
+            # unchanged, so back off
+            board.interval = min(board.interval * 2, _MAX_BOARD_INTERVAL)
+            board.next_poll = now + board.interval
+            return
+        self._add(board, -1)
+        board.score = board.opponent_score = 0.0
+        for username, score in data.board_scores.items():
+            if username.lower() in self.usernames:
+                board.score += score
+            else:
+                board.opponent_score += score
+        board.expected = board.opponent_expected = 0.0
+        ongoing = [game for game in data.games if game.end_time is None]
+        for game in ongoing:
+            if game.white.username.lower() in self.usernames:
+                ours, theirs = game.white, game.black
+            else:
+                ours, theirs = game.black, game.white
+            expected = _expected_score(ours.rating, theirs.rating)
+            board.expected += expected
+            board.opponent_expected += 1 - expected
+        board.finished = not ongoing
+        board.interval = _MIN_BOARD_INTERVAL
+        board.next_poll = now + board.interval
+        self._add(board, 1)
+
+    def print_score(self) -> None:
+        ongoing = sum(not board.finished for board in self.boards.values())
+        print(
+            f"{self.match.name}: {self.score:g}-{self.opponent_score:g}"
+            f" (projected {self.projected:.1f}-{self.opponent_projected:.1f},"
+            f" {ongoing} board(s) ongoing)"
+        )
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option("--match-url", "-u")
+@click.option("--cycles", "-n", type=int, default=0)
+@click.option("--workers", "-w", type=int, default=8)
+@click.option("--max-requests", "-m", type=int)
+def watch(
+    club_name: Optional[str] = None,
+    match_url: Optional[str] = None,
+    cycles: int = 0,
+    workers: int = 8,
+    max_requests: Optional[int] = None,
+) -> None:
+    """follows live scores of in-progress matches until they finish,
+    or for `cycles` rounds of polling"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    session = start_session(configs, max_requests, workers)
+    try:
+        club = Club.from_str(session, club_name)
+        if match_url:
+            match_apis = [match_url]
+        else:
+            in_progress = club.get_matches(session).in_progress
+            match_apis = [club_match.api for club_match in in_progress]
+        trackers: list[_MatchTracker] = []
+        for api in match_apis:
+            match = Match.from_str(session, api)
+            team = _get_team(match, club)
+            if team is None:
+                print(f"{club_name} isn't playing in {match.url}")
+                continue
+            trackers.append(_MatchTracker(match, team))
+        if not trackers:
+            print(f"no matches in progress for {club_name}")
+            return
+
+        cycle = 0
+        while not cycles or cycle < cycles:
+            now = int(time.time())
+            due = [
+                (tracker, board)
+                for tracker in trackers
+                for board in tracker.due(now)
+            ]
+            for (tracker, board), future in map_concurrently(
+                lambda item: Board.from_str_if_modified(
+                    session, item[1].api, item[1].etag
+                ),
+                due,
+                workers,
+            ):
+                try:
+                    data, board.etag = future.result()
+                except requests.exceptions.HTTPError:
+                    # try again later, as if the board hadn't changed
+                    data = None
+                tracker.update(board, data, now)
+            cycle += 1
+            print(f"cycle {cycle}, {len(due)} board(s) polled")
+            for tracker in trackers:
+                tracker.print_score()
+            polls = [
+                tracker.next_poll
+                for tracker in trackers
+                if tracker.next_poll is not None
+            ]
+            if not polls:
+                print("all matches finished")
+                break
+            if not cycles or cycle < cycles:
+                time.sleep(max(min(polls) - time.time(), 0))
+    except BudgetExceeded as e:
+        print(e)
+    finally:
+        log_session(session, club_name, "matches")
+
+
+def _rating(stats: Optional[_PlayerStats], variant: str) -> Optional[int]:
+    game_type = getattr(stats, variant, None) if stats else None
+    return game_type.last.rating if game_type else None
+
+
+def _pair_boards(
+    team: list[tuple[str, Optional[int]]],
+    opponents: list[tuple[str, Optional[int]]],
+) -> list[tuple[tuple[str, Optional[int]], tuple[str, Optional[int]]]]:
+    """pairs players by rating order, as boards are assigned at the start"""
+
+    def by_rating(player: tuple[str, Optional[int]]) -> tuple[bool, int]:
+        return (player[1] is None, -(player[1] or 0))
+
+    return list(
+        zip(sorted(team, key=by_rating), sorted(opponents, key=by_rating))
+    )
+
+
+def _expected_board_scores(
+    ratings: list[Optional[int]], opponents: list[Optional[int]]
+) -> list[float]:
+    """expected points out of two games for each board, in one pass"""
+    return [
+        2 * _expected_score(rating, opponent)
+        for rating, opponent in zip(ratings, opponents)
+    ]
+
+
+def _print_scouting(
+    match: Match, team: _MatchTeam, stats: dict[str, _PlayerStats]
+) -> None:
+    variant = f"{match.settings.rules}_{match.settings.time_class}"
+    opponent_team = (
+        match.teams.team2 if team is match.teams.team1 else match.teams.team1
+    )
+    team_ratings, opponent_ratings = (
+        [
+            (
+                player.username,
+                _rating(stats.get(player.username.lower()), variant),
+            )
+            for player in side.players
+        ]
+        for side in (team, opponent_team)
+    )
+    boards = _pair_boards(team_ratings, opponent_ratings)
+    expected = _expected_board_scores(
+        [ours[1] for ours, _ in boards], [theirs[1] for _, theirs in boards]
+    )
+    total = sum(expected)
+    print(
+        f"{match.name} vs {opponent_team.name}: expected"
+        f" {total:.1f}-{2 * len(boards) - total:.1f}"
+        f" over {len(boards)} board(s) {match.url}"
+    )
+    for number, ((ours, theirs), points) in enumerate(
+        zip(boards, expected), 1
+    ):
+        print(
+            f"{number}. {ours[0]} ({ours[1] or '?'})"
+            f" vs {theirs[0]} ({theirs[1] or '?'}): {points:.2f}"
+        )
+    unpaired = abs(len(team.players) - len(opponent_team.players))
+    if unpaired:
+        print(f"{unpaired} player(s) without an opponent yet")
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option("--match-url", "-u")
+@click.option("--workers", "-w", type=int, default=8)
+@click.option("--max-requests", "-m", type=int)
+def scout(
+    club_name: Optional[str] = None,
+    match_url: Optional[str] = None,
+    workers: int = 8,
+    max_requests: Optional[int] = None,
+) -> None:
+    """compares both teams board by board for one match,
+    or for every registered match of the club"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    max_age = configs.cache.stats_expiry * 3600
+    session = start_session(configs, max_requests, workers)
+    try:
+        club = Club.from_str(session, club_name)
+        if match_url:
+            match_apis = [match_url]
+        else:
+            registered = club.get_matches(session).registered
+            match_apis = [club_match.api for club_match in registered]
+        if not match_apis:
+            print(f"no open matches for {club_name}")
+            return
+        scouted: list[tuple[Match, _MatchTeam]] = []
+        for api in match_apis:
+            match = Match.from_str(session, api)
+            team = _get_team(match, club)
+            if team is None:
+                print(f"{club_name} isn't playing in {match.url}")
+                continue
+            scouted.append((match, team))
+
+        # players in several matches are only fetched once
+        cache = get_stats_cache()
+        try:
+            _refresh_stats(
+                session,
+                (
+                    player.username
+                    for match, _ in scouted
+                    for side in (match.teams.team1, match.teams.team2)
+                    for player in side.players
+                ),
+                cache,
+                max_age,
+                workers,
+            )
+        except BudgetExceeded as e:
+            # the report still goes out with whatever stats we have
+            print(e)
+        stats = cache.fresh(max_age)
+        for match, team in scouted:
+            _print_scouting(match, team, stats)
+    except BudgetExceeded as e:
+        print(e)
+    finally:
+        log_session(session, club_name, "matches")
+
+
+@click.group()
+def matches():
+    pass
+
+
+matches.add_command(eligible)
+matches.add_command(watch)
+matches.add_command(scout)
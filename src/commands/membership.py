@@ -1,23 +1,65 @@
+import itertools
+import math
+import tempfile
+import time
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Mapping, Optional
 
 import click
 import requests
 
+from ..utils.budget import (
+    MEMBERSHIP,
+    BudgetExceeded,
+    RequestBudget,
+    RequestPlanner,
+    estimate_membership_requests,
+    get_budgeted_session,
+    log_session,
+    start_session,
+)
 from ..utils.functions import (
+    get_club_index,
     get_member_records,
     get_player_id_map,
+    get_request_log,
+    get_profile_cache,
+    get_rollups,
+    get_stats_cache,
+    get_timeout_watches,
     get_username_map,
+    iter_existing_members,
+    log_requests,
+    map_concurrently,
+    updated_club_index,
     updated_members_data,
+    updated_profile_cache,
+    updated_rollups_data,
+    updated_stats_cache,
+    updated_timeout_watches,
+    write_members_data,
 )
 
+from ..utils.external import external_diff, merge_changes
+from ..utils.indexes import ClubIndex
+from ..utils.journal import CLOSED, LEFT, UNKNOWN, RunJournal
 from ..utils.structures import (
     Club,
     Configs,
     Member,
     MemberRecords,
+    RequestLogEntry,
+    TimeoutWatch,
+    _OngoingGame,
+    _PlayerStats,
+    _Rollup,
 )
 
+# how often members are checked for club match games close to timing out
+_MIN_POLL_INTERVAL = 3600
+_MATCH_POLL_INTERVAL = 6 * 3600
+_MAX_POLL_INTERVAL = 24 * 3600
+
 
 @dataclass
 class _BaseChangeCategory:
@@ -104,7 +146,11 @@ class _ChangeManager:
         changes.print_changes()
         _ChangeManager._update_records(record, changes)
 
-    def summarise(self, record: MemberRecords) -> None:
+    def summarise(
+        self, record: MemberRecords, total: Optional[int] = None
+    ) -> None:
+        """`total` is the number of current members, if `record`
+        only holds the members that changed"""
         for changes in (
             self.left,
             self.joined,
@@ -117,14 +163,83 @@ class _ChangeManager:
             self.renamed_returned,
         ):
             _ChangeManager._summarise_changes(record, changes)
-        print(f"total: {len(record.current)}")
+        print(f"total: {len(record.current) if total is None else total}")
+
+
+def _resolve_player_ids(
+    session: requests.Session,
+    members: list[Member],
+    journal: Optional[RunJournal] = None,
+) -> None:
+    for member in members:
+        if journal is not None:
+            member.player_id = member.player_id or journal.player_id(member)
+        if member.player_id is None:
+            member.update_player_id(session)
+            if journal is not None:
+                journal.add_player_id(member)
+
+
+def _get_departure(
+    session: requests.Session,
+    club: Club,
+    member: Member,
+    journal: Optional[RunJournal] = None,
+    index: Optional[ClubIndex] = None,
+) -> str:
+    """tells if a member who is no longer listed closed or left"""
+
+    if journal is not None:
+        outcome = journal.departure(club.url_name, member)
+        if outcome is not None:
+            return outcome
+    if index is not None and club.url_name in index.fetched:
+        # only a list fetched after the member was found gone, or in the
+        # same run, shows that the account is still open
+        since = index.updated[club.url_name]
+        if index.clubs_of(member.username, since) - {club.url_name}:
+            return LEFT
+    try:
+        # if api is accessible, check if player is still in the club
+        if club.url in member.get_club_urls(session):
+            # if so, the account is closed
+            outcome = CLOSED
+        else:
+            # else the member is gone
+            outcome = LEFT
+    except requests.exceptions.HTTPError:
+        # member renamed and either left or closed - we can't tell
+        outcome = UNKNOWN
+    if journal is not None:
+        journal.add_departure(club.url_name, member, outcome)
+    return outcome
 
 
 def _get_add_del_id_maps(
-    session: requests.Session, club: Club, record: MemberRecords
+    session: requests.Session,
+    club: Club,
+    record: MemberRecords,
+    journal: Optional[RunJournal] = None,
+    index: Optional[ClubIndex] = None,
 ) -> tuple[dict[int, Member], dict[int, Member]]:
-    existing_by_username = get_username_map(record.current.values())
-    incoming_by_username = get_username_map(club.get_members(session))
+    incoming = club.get_members(session)
+    if index is not None:
+        index.update_club(club.url_name, (m.username for m in incoming))
+    additions, deletions = _diff_members(record.current.values(), incoming)
+    _resolve_player_ids(session, additions, journal)
+    additions_by_id = get_player_id_map(additions)
+    deletions_by_id = get_player_id_map(deletions)
+    return (additions_by_id, deletions_by_id)
+
+
+def _diff_members(
+    existing: Iterable[Member], incoming: Iterable[Member]
+) -> tuple[list[Member], list[Member]]:
+    """members to add and delete by username, a member whose join time
+    changed is both deleted and added"""
+
+    existing_by_username = get_username_map(existing)
+    incoming_by_username = get_username_map(incoming)
     additions: list[Member] = []
     deletions: list[Member] = []
     for username in incoming_by_username.keys() | existing_by_username.keys():
@@ -138,24 +253,43 @@ def _get_add_del_id_maps(
         ):
             additions.append(incoming_by_username[username])
             deletions.append(existing_by_username[username])
-    for member in additions:
-        member.update_player_id(session)
-    additions_by_id = get_player_id_map(additions)
-    deletions_by_id = get_player_id_map(deletions)
-    return (additions_by_id, deletions_by_id)
+    return additions, deletions
 
 
 def _compare(
-    session: requests.Session, club_name: str, record: MemberRecords
-) -> None:
+    session: requests.Session,
+    club_name: str,
+    record: MemberRecords,
+    journal: Optional[RunJournal] = None,
+    index: Optional[ClubIndex] = None,
+) -> _ChangeManager:
     """compares membership and prints differences,
     outputs list of current and former members"""
 
     club = Club.from_str(session, club_name)
-    change_manager = _ChangeManager()
     additions_by_id, deletions_by_id = _get_add_del_id_maps(
-        session, club, record
+        session, club, record, journal, index
     )
+    change_manager = _classify(
+        additions_by_id,
+        deletions_by_id,
+        record.archive,
+        lambda member: _get_departure(session, club, member, journal, index),
+    )
+    change_manager.summarise(record)
+    return change_manager
+
+
+def _classify(
+    additions_by_id: dict[int, Member],
+    deletions_by_id: dict[int, Member],
+    archive: Mapping[int, Member],
+    get_departure: Callable[[Member], str],
+) -> _ChangeManager:
+    """sorts additions and deletions into categories of changes,
+    `get_departure` tells if a member who is gone closed or left"""
+
+    change_manager = _ChangeManager()
 
     # examining old names that disappeared
     for old_id in deletions_by_id:
@@ -176,30 +310,26 @@ def _compare(
             del additions_by_id[old_id]
         else:
             # the member is gone
-            try:
-                # if api is accessible, check if player is still in the club
-                if club.url in old.get_club_urls(session):
-                    # if so, the account is closed
-                    change_manager.closed.add_member(old)
-                else:
-                    # else the member is gone
-                    change_manager.left.add_member(old)
-            except requests.exceptions.HTTPError:
-                # member renamed and either left or closed - we can't tell
+            outcome = get_departure(old)
+            if outcome == CLOSED:
+                change_manager.closed.add_member(old)
+            elif outcome == LEFT:
+                change_manager.left.add_member(old)
+            else:
                 change_manager.renamed_gone.add_member(old)
 
     # examining the remaining new names
     for new_id in additions_by_id:
         new = additions_by_id[new_id]
         # check if we have record of this player
-        if new_id in record.archive:
+        if new_id in archive:
             # we have record of this player
             # if username is the same, the member hasn't renamed
             # if username is different, the member has renamed
             # if join time is the same, the member has reopened
             # if join time is different, the member has returned
             # (in which case we don't case if they closed and reopened)
-            old = record.archive[new_id]
+            old = archive[new_id]
             if old.username == new.username:
                 if old.joined == new.joined:
                     change_manager.reopened.add_member(old)
@@ -214,21 +344,167 @@ def _compare(
             # else this is a completely new member
             change_manager.joined.add_member(new)
 
-    change_manager.summarise(record)
+    return change_manager
+
+
+def _update_rollups(
+    club_name: str,
+    change_manager: _ChangeManager,
+    active: int,
+    members: Iterable[Member],
+) -> None:
+    """adds changes of this run to the club's rollups,
+    must be called after `summarise()`. `members` are all members on
+    record, only used up if the club has no rollups yet"""
+
+    now = int(time.time())
+    rollups = get_rollups(club_name)
+    first_run = not rollups.cohorts
+    rollups.add_joins(now, change_manager.joined.members)
+    for changes in (change_manager.left, change_manager.renamed_gone):
+        rollups.add_departures(now, changes.members)
+    rollups.add_departures(now, change_manager.closed.members, closed=True)
+    for returners in (
+        change_manager.returned,
+        change_manager.renamed_returned,
+    ):
+        rollups.add_returns(now, (new for _, new in returners.pairs), True)
+    rollups.add_returns(now, change_manager.reopened.members, False)
+    rollups.add_returns(
+        now, (new for _, new in change_manager.renamed_reopened.pairs), False
+    )
+    if first_run:
+        # cohorts of a club with no history come from the whole record
+        rollups.cohorts = {}
+        rollups.seed_cohorts(members)
+    rollups.set_active(now, active)
+    updated_rollups_data(club_name, rollups)
+
+
+def _compare_and_update_low_memory(
+    session: requests.Session,
+    club_name: str,
+    readonly: bool = False,
+    journal: Optional[RunJournal] = None,
+) -> int:
+    """same as `_compare()` followed by updating records, but sorts
+    members on disk rather than building maps of every member.
+    memory still grows with the club, as the /members response is
+    parsed whole before the first member is spilled to disk.
+    the club index isn't used, as that would hold every member."""
+
+    club = Club.from_str(session, club_name)
+    incoming_count = 0
+
+    def incoming() -> Iterator[Member]:
+        nonlocal incoming_count
+        for member in club.iter_members(session):
+            incoming_count += 1
+            yield member
+
+    with tempfile.TemporaryDirectory() as dir:
+        additions, deletions = external_diff(
+            (
+                member
+                for member in iter_existing_members(club_name)
+                if member.is_active
+            ),
+            incoming(),
+            dir,
+        )
+        _resolve_player_ids(session, additions, journal)
+        additions_by_id = get_player_id_map(additions)
+        deletions_by_id = get_player_id_map(deletions)
+        archive = get_player_id_map(
+            member
+            for member in iter_existing_members(club_name)
+            if not member.is_active and member.player_id in additions_by_id
+        )
+        change_manager = _classify(
+            additions_by_id,
+            deletions_by_id,
+            archive,
+            lambda member: _get_departure(session, club, member, journal),
+        )
+        # a record of just the members involved in changes
+        record = MemberRecords(
+            list(deletions_by_id.values()) + list(archive.values())
+        )
+        change_manager.summarise(record, incoming_count)
+        if not readonly:
+            changed = {**record.current, **record.archive}
+            write_members_data(
+                club_name,
+                merge_changes(iter_existing_members(club_name), changed, dir),
+            )
+            _update_rollups(
+                club_name,
+                change_manager,
+                incoming_count,
+                iter_existing_members(club_name),
+            )
+    return incoming_count
 
 
 def _compare_and_update(
-    session: requests.Session, club_name: str, readonly: bool = False
-):
+    session: requests.Session,
+    club_name: str,
+    readonly: bool = False,
+    journal: Optional[RunJournal] = None,
+    index: Optional[ClubIndex] = None,
+    low_memory: bool = False,
+) -> int:
+    """returns the number of current members after the update"""
+
     print(
         "checking membership changes"
         + (" without updating record" if readonly else "")
         + f" for {club_name}"
     )
-    record = get_member_records(club_name)
-    _compare(session, club_name, record)
-    if not readonly:
-        updated_members_data(club_name, record)
+    if low_memory:
+        active = _compare_and_update_low_memory(
+            session, club_name, readonly, journal
+        )
+    else:
+        record = get_member_records(club_name)
+        change_manager = _compare(session, club_name, record, journal, index)
+        if not readonly:
+            updated_members_data(club_name, record)
+            _update_rollups(
+                club_name,
+                change_manager,
+                len(record.current),
+                itertools.chain(
+                    record.current.values(), record.archive.values()
+                ),
+            )
+        active = len(record.current)
+    if journal is not None:
+        journal.complete(club_name)
+    return active
+
+
+def _plan_membership(
+    club_names: list[str], log: list[RequestLogEntry]
+) -> RequestPlanner:
+    planner = RequestPlanner()
+    for name in club_names:
+        history = [
+            entry.requests
+            for entry in log
+            if entry.club_name == name
+            and entry.task == MEMBERSHIP
+            and entry.size
+        ]
+        if history:
+            estimate = estimate_membership_requests(0, history)
+        else:
+            size = sum(
+                member.is_active for member in iter_existing_members(name)
+            )
+            estimate = estimate_membership_requests(size)
+        planner.add(MEMBERSHIP, name, estimate)
+    return planner
 
 
 def _get_club_names(
@@ -256,15 +532,41 @@ def _get_club_names(
         return [configs.default_club_name]
 
 
-@click.command()
+@click.group(invoke_without_command=True)
+@click.pass_context
 @click.option("--club-name", "-c")
 @click.option("--all-clubs", "-a", is_flag=True, default=False)
-@click.option("--readonly", "-r", is_flag=True, default=False)
+@click.option(
+    "--readonly",
+    "-r",
+    is_flag=True,
+    default=False,
+    help="don't update member records, the club index is still refreshed",
+)
+@click.option("--max-requests", "-m", type=int)
+@click.option("--plan", "-p", is_flag=True, default=False)
+@click.option("--resume", is_flag=True, default=False)
+@click.option(
+    "--low-memory",
+    "-l",
+    is_flag=True,
+    default=False,
+    help="sort member lists on disk instead of in memory, the club's "
+    "/members response is still parsed whole",
+)
 def membership(
+    ctx: click.Context,
     club_name: Optional[str] = None,
     all_clubs: bool = False,
     readonly: bool = False,
+    max_requests: Optional[int] = None,
+    plan: bool = False,
+    resume: bool = False,
+    low_memory: bool = False,
 ) -> None:
+    if ctx.invoked_subcommand is not None:
+        return
+
     if club_name and all_clubs:
         message = "`membership()` cannot take both `club_name` and `all_clubs`"
         raise SystemExit(message)
@@ -273,8 +575,425 @@ def membership(
 
     club_names = _get_club_names(configs, club_name, all_clubs, readonly)
 
-    if club_names:
+    if not club_names:
+        print("no club found in configs")
+        return
+
+    journal = RunJournal.resume() if resume else RunJournal()
+    if resume and journal.is_empty:
+        print("no interrupted run to resume")
+    elif resume:
+        if not journal.matches(club_names, readonly):
+            raise SystemExit(
+                "the interrupted run was for "
+                + journal.options["clubs"].replace(",", ", ")
+                + (" without updating records" if journal.readonly else "")
+                + " - `--resume` needs the same options"
+            )
         for name in club_names:
-            _compare_and_update(configs.session, name, readonly)
+            if journal.is_complete(name):
+                print(
+                    f"skipping {name} - already checked in the interrupted run"
+                )
+
+    log = get_request_log()
+    budget = RequestBudget.from_configs(configs, log, max_requests)
+    planner = _plan_membership(
+        [name for name in club_names if not journal.is_complete(name)], log
+    )
+    if plan:
+        planner.print_plan(budget.remaining)
+        return
+    # readonly runs don't touch the journal, so they can't spoil a run
+    # that is waiting to be resumed
+    run_journal: Optional[RunJournal] = None
+    if not readonly:
+        run_journal = (
+            journal
+            if not journal.is_empty
+            else RunJournal.start(club_names, readonly)
+        )
+
+    admitted, deferred = planner.schedule(budget.remaining)
+    if deferred:
+        print(
+            "skipping due to request budget: "
+            + ", ".join(task.name for task in deferred)
+        )
+    session = get_budgeted_session(configs, budget)
+    # the index holds every member of every tracked club, which is what
+    # low memory mode stays clear of
+    index = (
+        None
+        if low_memory
+        else get_club_index(configs.cache.index_expiry * 3600)
+    )
+    for task in admitted:
+        used = budget.used
+        # unfinished runs are logged with no size to keep them out of estimates
+        size = 0
+        try:
+            size = _compare_and_update(
+                session, task.name, readonly, run_journal, index, low_memory
+            )
+        except BudgetExceeded as e:
+            print(f"{e} - stopped before updating {task.name}")
+            if run_journal is not None:
+                print("use `--resume` to continue where this run stopped")
+            break
+        finally:
+            log_requests(
+                RequestLogEntry(
+                    int(time.time()),
+                    task.name,
+                    MEMBERSHIP,
+                    budget.used - used,
+                    size,
+                )
+            )
     else:
-        print("no club found in configs")
+        if not deferred and run_journal is not None:
+            RunJournal.finish()
+    if index is not None and index.fetched:
+        # written once, as it holds every member of every tracked club
+        updated_club_index(index)
+
+
+def _print_rollups(periods: dict[str, _Rollup], limit: int) -> None:
+    columns = ("period", "joins", "departures", "closures", "returns")
+    print(*columns, "active", "net", sep="\t")
+    for period, rollup in sorted(periods.items())[-limit:]:
+        print(
+            period,
+            rollup.joins,
+            rollup.departures,
+            rollup.closures,
+            rollup.returns,
+            rollup.active,
+            f"{rollup.net:+}",
+            sep="\t",
+        )
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option(
+    "--period",
+    "-p",
+    type=click.Choice(["daily", "weekly"]),
+    default="weekly",
+)
+@click.option("--limit", "-l", type=int, default=12)
+def stats(
+    club_name: Optional[str] = None,
+    period: str = "weekly",
+    limit: int = 12,
+) -> None:
+    """prints membership trends from rollups kept by previous runs"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    rollups = get_rollups(club_name)
+    if not rollups.daily:
+        print(f"no membership history for {club_name}")
+        return
+
+    print(f"{period} membership changes for {club_name}:")
+    _print_rollups(
+        rollups.daily if period == "daily" else rollups.weekly, limit
+    )
+
+    print("churn by join cohort:")
+    print("cohort", "joined", "departed", "rate", sep="\t")
+    for cohort, counts in sorted(rollups.cohorts.items())[-limit:]:
+        print(
+            cohort,
+            counts.joined,
+            counts.departed,
+            f"{counts.churn_rate:.1%}",
+            sep="\t",
+        )
+
+    median = rollups.median_tenure
+    if median is not None:
+        goners = sum(rollups.tenures.values())
+        print(f"median tenure of goners: {median:g} days ({goners} goners)")
+
+
+def _schedule_watch(
+    watch: TimeoutWatch,
+    games: list[_OngoingGame],
+    match_apis: set[str],
+    now: int,
+) -> None:
+    """the closer a member is to timing out, the sooner they're checked"""
+
+    match_games = [game for game in games if game.match in match_apis]
+    deadlines = [
+        (game.move_by, game.url)
+        for game in match_games
+        if game.move_by and game.to_move(watch.username)
+    ]
+    if deadlines:
+        watch.deadline, watch.game = min(deadlines)
+        interval = (watch.deadline - now) // 4
+        interval = max(_MIN_POLL_INTERVAL, min(interval, _MATCH_POLL_INTERVAL))
+    else:
+        watch.deadline, watch.game = 0, ""
+        interval = _MATCH_POLL_INTERVAL if match_games else _MAX_POLL_INTERVAL
+    watch.next_poll = now + interval
+
+
+def _due_watches(
+    watches: Iterable[TimeoutWatch], now: int, all_members: bool = False
+) -> list[TimeoutWatch]:
+    """watches to poll, earliest known deadline first"""
+    return sorted(
+        (watch for watch in watches if all_members or watch.next_poll <= now),
+        key=lambda watch: (watch.deadline or math.inf, watch.next_poll),
+    )
+
+
+def _at_risk(
+    watches: Iterable[TimeoutWatch], now: int, hours: int
+) -> list[TimeoutWatch]:
+    """watches with a deadline within `hours`, soonest first. deadlines
+    that have passed since they were last checked are stale, the member
+    has either moved or timed out."""
+    return sorted(
+        (
+            watch
+            for watch in watches
+            if now < watch.deadline < now + hours * 3600
+        ),
+        key=lambda watch: watch.deadline,
+    )
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option("--max-requests", "-m", type=int)
+@click.option("--workers", "-w", type=int, default=8)
+@click.option("--hours", type=int, default=24)
+@click.option("--all-members", "-a", is_flag=True, default=False)
+def timeouts(
+    club_name: Optional[str] = None,
+    max_requests: Optional[int] = None,
+    workers: int = 8,
+    hours: int = 24,
+    all_members: bool = False,
+) -> None:
+    """lists members with less than `hours` left to move in club matches,
+    checking the members most at risk first"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    members = get_member_records(club_name).current.values()
+    existing = get_timeout_watches(club_name)
+    watches = {
+        member.username: existing.get(
+            member.username, TimeoutWatch(member.username)
+        )
+        for member in members
+    }
+    now = int(time.time())
+    due = _due_watches(watches.values(), now, all_members)
+
+    session = start_session(configs, max_requests, workers)
+    checked: set[str] = set()
+    try:
+        club = Club.from_str(session, club_name)
+        match_apis = {
+            club_match.api
+            for club_match in club.get_matches(session).in_progress
+        }
+        remaining = session.budget.remaining
+        if remaining is not None:
+            due = due[:remaining]
+        print(f"checking games of {len(due)} of {len(watches)} member(s)")
+        for watch, future in map_concurrently(
+            lambda watch: Member(watch.username).get_ongoing_games(session),
+            due,
+            workers,
+        ):
+            try:
+                games = future.result()
+            except requests.exceptions.HTTPError:
+                continue
+            _schedule_watch(watch, games, match_apis, now)
+            checked.add(watch.username)
+    except BudgetExceeded as e:
+        print(e)
+    finally:
+        updated_timeout_watches(club_name, watches)
+        log_session(session, club_name, "timeouts")
+
+    at_risk = _at_risk(watches.values(), now, hours)
+    print(f"checked {len(checked)} member(s), {len(at_risk)} at risk:")
+    for watch in at_risk:
+        left = (watch.deadline - now) / 3600
+        stale = "" if watch.username in checked else " (as of an earlier run)"
+        print(watch.username, f"{left:.1f} hrs{stale}", watch.game)
+
+
+_SweptMember = tuple[
+    Optional[tuple[int, Optional[str]]], Optional[_PlayerStats]
+]
+
+
+def _describe_activity(
+    username: str,
+    last_online: int,
+    player_stats: Optional[_PlayerStats],
+    cutoff: int,
+    now: int,
+) -> Optional[str]:
+    """describes a member who is inactive or has no daily games,
+    returns `None` for everyone else"""
+
+    inactive = last_online < cutoff
+    no_daily = player_stats is not None and (
+        player_stats.chess_daily is None
+        and player_stats.chess960_daily is None
+    )
+    if not inactive and not no_daily:
+        return None
+    seen = (
+        f"last online {(now - last_online) // 86400} days ago"
+        if last_online
+        else "last online unknown"
+    )
+    return f"{username}: {seen}" + (", no daily games" if no_daily else "")
+
+
+@click.command()
+@click.option("--club-name", "-c")
+@click.option("--days", "-d", type=int, default=30)
+@click.option("--workers", "-w", type=int, default=8)
+@click.option("--max-requests", "-m", type=int)
+def activity(
+    club_name: Optional[str] = None,
+    days: int = 30,
+    workers: int = 8,
+    max_requests: Optional[int] = None,
+) -> None:
+    """lists members not online for `days` days or with no daily games,
+    only fetching profiles and stats older than configured"""
+
+    configs = Configs.from_yaml()
+    club_name = _get_club_names(configs, club_name)[0]
+    profile_age = configs.cache.profile_expiry * 3600
+    stats_age = configs.cache.stats_expiry * 3600
+    profiles = get_profile_cache()
+    stats_cache = get_stats_cache()
+    now = int(time.time())
+    cutoff = now - days * 86400
+
+    def cached_last_online(username: str) -> int:
+        entry = profiles.get(username)
+        return entry.last_online if entry else 0
+
+    # members who were least active last time are checked first
+    usernames = sorted(
+        (
+            member.username
+            for member in get_member_records(club_name).current.values()
+        ),
+        key=cached_last_online,
+    )
+    # results are printed in the order above, each one as soon as every
+    # member before it is done, then ranked again by fresh data at the end
+    done: dict[str, Optional[str]] = {}
+    found: dict[str, str] = {}
+    position = 0
+
+    def describe(username: str) -> Optional[str]:
+        return _describe_activity(
+            username,
+            cached_last_online(username),
+            stats_cache.get(username, stats_age),
+            cutoff,
+            now,
+        )
+
+    def report(username: str, description: Optional[str]) -> None:
+        nonlocal position
+        done[username] = description
+        while position < len(usernames) and usernames[position] in done:
+            description = done.pop(usernames[position])
+            if description:
+                found[usernames[position]] = description
+                print(description)
+            position += 1
+
+    def sweep(username: str) -> _SweptMember:
+        """fetches whatever is stale for a member, the profile as
+        last online time and etag"""
+        player = Member(username=username)
+        profile = None
+        if not profiles.is_fresh(username, profile_age):
+            entry = profiles.get(username)
+            data, etag = player.get_profile_if_modified(
+                session, entry.etag if entry else None
+            )
+            last_online = (
+                (data.last_online or 0)
+                if data
+                else cached_last_online(username)
+            )
+            profile = (last_online, etag)
+        player_stats = None
+        if stats_cache.get(username, stats_age) is None:
+            player_stats = player.get_stats(session)
+        return profile, player_stats
+
+    stale = {
+        username
+        for username in usernames
+        if not profiles.is_fresh(username, profile_age)
+        or stats_cache.get(username, stats_age) is None
+    }
+    print(f"checking {len(stale)} of {len(usernames)} member(s)")
+    print("least recently online when last checked first:")
+    for username in usernames:
+        if username not in stale:
+            report(username, describe(username))
+    session = start_session(configs, max_requests, workers)
+    try:
+        for username, future in map_concurrently(
+            sweep,
+            [username for username in usernames if username in stale],
+            workers,
+        ):
+            try:
+                profile, player_stats = future.result()
+            except requests.exceptions.HTTPError:
+                # account closed or renamed since the last membership check
+                report(username, None)
+                continue
+            if profile is not None:
+                profiles.set(username, profile[1], profile[0])
+            if player_stats is not None:
+                stats_cache.set(username, player_stats)
+            report(username, describe(username))
+    except BudgetExceeded as e:
+        print(e)
+        # members left unchecked hold back the ones after them
+        for username in usernames[position:]:
+            description = done.get(username)
+            if description:
+                found[username] = description
+                print(description)
+    finally:
+        updated_profile_cache(profiles)
+        updated_stats_cache(stats_cache)
+        log_session(session, club_name, "activity")
+
+    print(f"{len(found)} member(s), least recently online first:")
+    for username in sorted(found, key=cached_last_online):
+        print(found[username])
+
+
+membership.add_command(stats)
+membership.add_command(timeouts)
+membership.add_command(activity)
@@ -37,6 +37,8 @@ import click
 # 6.1.3. eliminate if country doesn't match per config
 
 # 6.2. get candidate clubs
+# (`ClubIndex` answers for tracked clubs without a request - only fetch
+# the candidate's clubs if it can't rule them in or out)
 # 6.2.1. eliminate if candidate is in too many clubs per config
 # 6.2.1. eliminate if candidate is in certain clubs per config
 
@@ -0,0 +1,237 @@
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import requests
+
+from .functions import get_request_log, log_requests
+from .structures import (
+    Configs,
+    RequestLogEntry,
+    _PlayerStats,
+    _RecruitmentConfigs,
+)
+
+# tasks with a lower priority value are scheduled first
+MEMBERSHIP = "membership"
+RECRUITMENT = "recruitment"
+_PRIORITIES = {MEMBERSHIP: 0, RECRUITMENT: 1}
+
+# rough request counts used when a club has no history yet
+_DEFAULT_CHURN_RATE = 0.01
+_REQUESTS_PER_CLUB = 2
+_REQUESTS_PER_CANDIDATE = 5
+_HISTORY_LENGTH = 5
+
+
+class BudgetExceeded(Exception):
+    """raised when a request would go over the request budget"""
+
+
+class RequestBudget:
+    """keeps count of api requests against per-run and per-hour limits.
+    `recent` is the number of requests already made in the last hour."""
+
+    def __init__(
+        self,
+        per_run: Optional[int] = None,
+        per_hour: Optional[int] = None,
+        recent: int = 0,
+    ) -> None:
+        self.per_run = per_run
+        self.per_hour = per_hour
+        self.recent = recent
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_configs(
+        configs: Configs,
+        log: Iterable[RequestLogEntry],
+        per_run: Optional[int] = None,
+    ) -> "RequestBudget":
+        """`per_run` overrides the limit in `configs.yml`"""
+        an_hour_ago = int(time.time()) - 3600
+        recent = sum(
+            entry.requests for entry in log if entry.timestamp > an_hour_ago
+        )
+        return RequestBudget(
+            (
+                per_run
+                if per_run is not None
+                else configs.budget.max_requests_per_run
+            ),
+            configs.budget.max_requests_per_hour,
+            recent,
+        )
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """requests left before a limit is hit, `None` if unlimited"""
+        limits: list[int] = []
+        if self.per_run is not None:
+            limits.append(self.per_run - self.used)
+        if self.per_hour is not None:
+            limits.append(self.per_hour - self.recent - self.used)
+        return max(min(limits), 0) if limits else None
+
+    def charge(self) -> None:
+        with self._lock:
+            if self.remaining == 0:
+                raise BudgetExceeded(
+                    f"request budget used up ({self.used} made)"
+                )
+            self.used += 1
+
+
+class BudgetedSession(requests.Session):
+    """session that charges every request to a `RequestBudget`"""
+
+    def __init__(self, budget: RequestBudget) -> None:
+        super().__init__()
+        self.budget = budget
+
+    def request(self, *args, **kwargs) -> requests.Response:
+        self.budget.charge()
+        return super().request(*args, **kwargs)
+
+
+def get_budgeted_session(
+    configs: Configs, budget: RequestBudget
+) -> BudgetedSession:
+    session = BudgetedSession(budget)
+    session.headers.update(configs._http_header)
+    return session
+
+
+def start_session(
+    configs: Configs, max_requests: Optional[int] = None, workers: int = 1
+) -> BudgetedSession:
+    """budgeted session for commands that make a single batch of requests,
+    `workers` is the number of threads that will share it"""
+    budget = RequestBudget.from_configs(
+        configs, get_request_log(), max_requests
+    )
+    session = get_budgeted_session(configs, budget)
+    if workers > 1:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        session.mount("https://", adapter)
+    return session
+
+
+def log_session(session: BudgetedSession, club_name: str, task: str) -> None:
+    log_requests(
+        RequestLogEntry(int(time.time()), club_name, task, session.budget.used)
+    )
+
+
+# estimates
+
+
+def estimate_membership_requests(
+    club_size: int, history: Iterable[int] = ()
+) -> int:
+    """estimates requests for checking membership of one club,
+    from request counts of previous runs if there are any,
+    otherwise from the number of members on record"""
+
+    recent = list(history)[-_HISTORY_LENGTH:]
+    if recent:
+        return math.ceil(sum(recent) / len(recent))
+    # each joiner needs a profile, each leaver needs a clubs lookup
+    return _REQUESTS_PER_CLUB + 2 * math.ceil(club_size * _DEFAULT_CHURN_RATE)
+
+
+def estimate_recruitment_requests(candidates: int, target_clubs: int) -> int:
+    return (
+        target_clubs * _REQUESTS_PER_CLUB
+        + candidates * _REQUESTS_PER_CANDIDATE
+    )
+
+
+def candidate_likelihood(
+    stats: _PlayerStats, configs: _RecruitmentConfigs
+) -> float:
+    """how comfortably a candidate passes the rating and move time filters,
+    from 0 (fails or marginal) to 1 (well inside all limits)"""
+
+    daily = stats.chess_daily
+    if daily is None:
+        return 0.0
+    half_range = (configs.max_elo - configs.min_elo) / 2
+    if half_range <= 0:
+        return 0.0
+    rating_margin = (
+        min(
+            daily.last.rating - configs.min_elo,
+            configs.max_elo - daily.last.rating,
+        )
+        / half_range
+    )
+    max_secs_per_move = configs.max_hrs_per_move * 3600
+    move_margin = 1 - daily.record.time_per_move / max_secs_per_move
+    return max(min(rating_margin, move_margin, 1.0), 0.0)
+
+
+# scheduling
+
+
+@dataclass(order=True)
+class _PlannedTask:
+    sort_key: tuple[int, float] = field(init=False, repr=False)
+    task: str = field(compare=False)
+    name: str = field(compare=False)
+    estimate: int = field(compare=False)
+    likelihood: float = field(default=1.0, compare=False)
+
+    def __post_init__(self) -> None:
+        self.sort_key = (_PRIORITIES[self.task], -self.likelihood)
+
+
+class RequestPlanner:
+    """orders planned work by value and fits it into a request budget"""
+
+    def __init__(self) -> None:
+        self.tasks: list[_PlannedTask] = []
+
+    def add(
+        self, task: str, name: str, estimate: int, likelihood: float = 1.0
+    ) -> None:
+        """`likelihood` ranks tasks of the same kind, higher goes first"""
+        self.tasks.append(_PlannedTask(task, name, estimate, likelihood))
+
+    @property
+    def total(self) -> int:
+        return sum(task.estimate for task in self.tasks)
+
+    def schedule(
+        self, remaining: Optional[int]
+    ) -> tuple[list[_PlannedTask], list[_PlannedTask]]:
+        """returns tasks that fit in the budget and tasks that don't,
+        both in order of priority"""
+
+        admitted: list[_PlannedTask] = []
+        deferred: list[_PlannedTask] = []
+        for task in sorted(self.tasks):
+            if remaining is None or task.estimate <= remaining:
+                admitted.append(task)
+                if remaining is not None:
+                    remaining -= task.estimate
+            else:
+                deferred.append(task)
+        return admitted, deferred
+
+    def print_plan(self, remaining: Optional[int]) -> None:
+        admitted, deferred = self.schedule(remaining)
+        print(
+            f"estimated requests: {self.total}"
+            + (f" (budget: {remaining})" if remaining is not None else "")
+        )
+        for task in admitted:
+            print(f"{task.task} {task.name}: ~{task.estimate}")
+        if deferred:
+            print(f"deferred ({len(deferred)}):")
+            for task in deferred:
+                print(f"{task.task} {task.name}: ~{task.estimate}")
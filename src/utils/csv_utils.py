@@ -1,15 +1,66 @@
 import csv
 import os
+from typing import Iterable, Iterator
 
-from .structures import Member, MemberRecords
+from .indexes import ClubIndex
+from .structures import (
+    Member,
+    MemberRecords,
+    CachedProfile,
+    MembershipRollups,
+    ProfileCache,
+    RequestLogEntry,
+    StatsCache,
+    TimeoutWatch,
+    _Cohort,
+    _PlayerGameTypeLast,
+    _PlayerGameTypeRecord,
+    _PlayerGameTypeStats,
+    _PlayerStats,
+    _Rollup,
+)
 
 DIR = "CSV_files/{}"
 PATH = f"{DIR}/members.csv"
 HEADER = ("username", "player_id", "joined", "is_active")
+ROLLUP_PATH = f"{DIR}/{{}}.csv"
+ROLLUP_HEADER = (
+    "period",
+    "joins",
+    "departures",
+    "closures",
+    "returns",
+    "active",
+)
+COHORT_HEADER = ("cohort", "joined", "departed")
+TENURE_HEADER = ("days", "count")
+TIMEOUTS_PATH = f"{DIR}/timeouts.csv"
+TIMEOUTS_HEADER = ("username", "next_poll", "deadline", "game")
+CLUB_INDEX_PATH = "CSV_files/club_index.csv"
+CLUB_INDEX_HEADER = ("club_name", "updated", "username")
+STATS_PATH = "CSV_files/player_stats.csv"
+STATS_HEADER = (
+    "username",
+    "fetched",
+    "variant",
+    "rating",
+    "wins",
+    "draws",
+    "losses",
+    "time_per_move",
+    "timeout_percent",
+)
+STATS_VARIANTS = ("chess_daily", "chess960_daily")
+PROFILES_PATH = "CSV_files/player_profiles.csv"
+PROFILES_HEADER = ("username", "fetched", "etag", "last_online")
+JOURNAL_PATH = "CSV_files/journal.csv"
+JOURNAL_HEADER = ("kind", "club_name", "key", "value")
+REQUEST_LOG_PATH = "CSV_files/request_log.csv"
+REQUEST_LOG_HEADER = ("timestamp", "club_name", "task", "requests", "size")
 
 
-def get_existing_members_from_csv(club_name: str) -> list[Member]:
-    members: list[Member] = []
+def iter_existing_members_from_csv(club_name: str) -> Iterator[Member]:
+    """streams members from the csv file without holding them all"""
     try:
         with open(PATH.format(club_name)) as stream:
             reader = csv.reader(stream)
@@ -22,14 +73,22 @@ def get_existing_members_from_csv(club_name: str) -> list[Member]:
                     is_active=bool(int(row[3])),
                 )
                 if member.username and member.player_id and member.joined:
-                    members.append(member)
+                    yield member
     except FileNotFoundError:
         print(f"error getting file from {PATH.format(club_name)}")
-    return members
+
+
+def get_existing_members_from_csv(club_name: str) -> list[Member]:
+    return list(iter_existing_members_from_csv(club_name))
 
 
 def update_members_csv(club_name: str, record: MemberRecords) -> None:
     members = sorted(record.all, key=lambda x: (not x.is_active, x.username))
+    write_members_csv(club_name, members)
+
+
+def write_members_csv(club_name: str, members: Iterable[Member]) -> None:
+    """writes members in the order given"""
     dir = DIR.format(club_name)
     if not os.path.exists(dir):
         os.makedirs(dir)
@@ -42,3 +101,260 @@ def update_members_csv(club_name: str, record: MemberRecords) -> None:
             joined = str(member.joined) if member.joined else "0"
             is_active = "1" if member.is_active else "0"
             writer.writerow((username, player_id, joined, is_active))
+
+
+def get_request_log_from_csv() -> list[RequestLogEntry]:
+    entries: list[RequestLogEntry] = []
+    try:
+        with open(REQUEST_LOG_PATH) as stream:
+            reader = csv.reader(stream)
+            next(reader)
+            for row in reader:
+                entries.append(
+                    RequestLogEntry(
+                        timestamp=int(row[0]),
+                        club_name=row[1],
+                        task=row[2],
+                        requests=int(row[3]),
+                        size=int(row[4]),
+                    )
+                )
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def append_request_log_csv(entry: RequestLogEntry) -> None:
+    new_file = not os.path.exists(REQUEST_LOG_PATH)
+    dir = os.path.dirname(REQUEST_LOG_PATH)
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    with open(REQUEST_LOG_PATH, "a", newline="\n") as stream:
+        writer = csv.writer(stream)
+        if new_file:
+            writer.writerow(REQUEST_LOG_HEADER)
+        writer.writerow(
+            (
+                str(entry.timestamp),
+                entry.club_name,
+                entry.task,
+                str(entry.requests),
+                str(entry.size),
+            )
+        )
+
+
+def _read_rows(path: str) -> list[list[str]]:
+    try:
+        with open(path) as stream:
+            reader = csv.reader(stream)
+            next(reader)
+            return list(reader)
+    except FileNotFoundError:
+        return []
+
+
+def _write_rows(path: str, header: tuple[str, ...], rows: list[tuple]) -> None:
+    dir = os.path.dirname(path)
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    with open(path, "w", newline="\n") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def get_rollups_from_csv(club_name: str) -> MembershipRollups:
+    rollups = MembershipRollups()
+    for granularity, periods in (
+        ("daily", rollups.daily),
+        ("weekly", rollups.weekly),
+    ):
+        for row in _read_rows(ROLLUP_PATH.format(club_name, granularity)):
+            periods[row[0]] = _Rollup(*(int(value) for value in row[1:]))
+    for row in _read_rows(ROLLUP_PATH.format(club_name, "cohorts")):
+        rollups.cohorts[row[0]] = _Cohort(int(row[1]), int(row[2]))
+    for row in _read_rows(ROLLUP_PATH.format(club_name, "tenures")):
+        rollups.tenures[int(row[0])] = int(row[1])
+    return rollups
+
+
+def update_rollups_csv(club_name: str, rollups: MembershipRollups) -> None:
+    for granularity, periods in (
+        ("daily", rollups.daily),
+        ("weekly", rollups.weekly),
+    ):
+        _write_rows(
+            ROLLUP_PATH.format(club_name, granularity),
+            ROLLUP_HEADER,
+            [
+                (
+                    period,
+                    rollup.joins,
+                    rollup.departures,
+                    rollup.closures,
+                    rollup.returns,
+                    rollup.active,
+                )
+                for period, rollup in sorted(periods.items())
+            ],
+        )
+    _write_rows(
+        ROLLUP_PATH.format(club_name, "cohorts"),
+        COHORT_HEADER,
+        [
+            (cohort, counts.joined, counts.departed)
+            for cohort, counts in sorted(rollups.cohorts.items())
+        ],
+    )
+    _write_rows(
+        ROLLUP_PATH.format(club_name, "tenures"),
+        TENURE_HEADER,
+        sorted(rollups.tenures.items()),
+    )
+
+
+def get_journal_entries_from_csv() -> list[tuple[str, str, str, str]]:
+    return [
+        (row[0], row[1], row[2], row[3])
+        for row in _read_rows(JOURNAL_PATH)
+        if len(row) == 4
+    ]
+
+
+def append_journal_csv(entry: tuple[str, str, str, str]) -> None:
+    new_file = not os.path.exists(JOURNAL_PATH)
+    dir = os.path.dirname(JOURNAL_PATH)
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    with open(JOURNAL_PATH, "a", newline="\n") as stream:
+        writer = csv.writer(stream)
+        if new_file:
+            writer.writerow(JOURNAL_HEADER)
+        writer.writerow(entry)
+
+
+def remove_journal_csv() -> None:
+    if os.path.exists(JOURNAL_PATH):
+        os.remove(JOURNAL_PATH)
+
+
+def get_stats_cache_from_csv() -> StatsCache:
+    cache = StatsCache()
+    for row in _read_rows(STATS_PATH):
+        username, fetched, variant = row[0], int(row[1]), row[2]
+        entry = cache.entries.get(username)
+        if entry is None or entry[0] != fetched:
+            entry = (fetched, _PlayerStats())
+            cache.entries[username] = entry
+        # players without daily stats are kept with an empty variant
+        if variant in STATS_VARIANTS:
+            setattr(
+                entry[1],
+                variant,
+                _PlayerGameTypeStats(
+                    last=_PlayerGameTypeLast(rating=int(row[3])),
+                    record=_PlayerGameTypeRecord(
+                        wins=int(row[4]),
+                        draws=int(row[5]),
+                        losses=int(row[6]),
+                        time_per_move=int(row[7]),
+                        timeout_percent=float(row[8]),
+                    ),
+                ),
+            )
+    return cache
+
+
+def update_stats_cache_csv(cache: StatsCache) -> None:
+    rows: list[tuple] = []
+    for username, (fetched, stats) in sorted(cache.entries.items()):
+        variants = [
+            (variant, getattr(stats, variant))
+            for variant in STATS_VARIANTS
+            if getattr(stats, variant) is not None
+        ]
+        if not variants:
+            rows.append((username, fetched, "", 0, 0, 0, 0, 0, 0.0))
+        for variant, game_type in variants:
+            record = game_type.record
+            rows.append(
+                (
+                    username,
+                    fetched,
+                    variant,
+                    game_type.last.rating,
+                    record.wins,
+                    record.draws,
+                    record.losses,
+                    record.time_per_move,
+                    record.timeout_percent,
+                )
+            )
+    _write_rows(STATS_PATH, STATS_HEADER, rows)
+
+
+def get_timeout_watches_from_csv(club_name: str) -> dict[str, TimeoutWatch]:
+    watches: dict[str, TimeoutWatch] = {}
+    for row in _read_rows(TIMEOUTS_PATH.format(club_name)):
+        watches[row[0]] = TimeoutWatch(
+            row[0], int(row[1]), int(row[2]), row[3]
+        )
+    return watches
+
+
+def update_timeout_watches_csv(
+    club_name: str, watches: dict[str, TimeoutWatch]
+) -> None:
+    _write_rows(
+        TIMEOUTS_PATH.format(club_name),
+        TIMEOUTS_HEADER,
+        [
+            (watch.username, watch.next_poll, watch.deadline, watch.game)
+            for _, watch in sorted(watches.items())
+        ],
+    )
+
+
+def get_club_index_from_csv() -> ClubIndex:
+    index = ClubIndex()
+    members: dict[str, list[str]] = {}
+    for row in _read_rows(CLUB_INDEX_PATH):
+        index.updated[row[0]] = int(row[1])
+        # clubs with no members are kept with an empty username
+        members.setdefault(row[0], [])
+        if row[2]:
+            members[row[0]].append(row[2])
+    for club_name, usernames in members.items():
+        index.update_club(club_name, usernames, index.updated[club_name])
+    return index
+
+
+def update_club_index_csv(index: ClubIndex) -> None:
+    rows: list[tuple] = []
+    for club_name, usernames in sorted(index.members.items()):
+        updated = index.updated[club_name]
+        rows.extend(
+            (club_name, updated, username) for username in sorted(usernames)
+        )
+        if not usernames:
+            rows.append((club_name, updated, ""))
+    _write_rows(CLUB_INDEX_PATH, CLUB_INDEX_HEADER, rows)
+
+
+def get_profile_cache_from_csv() -> ProfileCache:
+    cache = ProfileCache()
+    for row in _read_rows(PROFILES_PATH):
+        cache.entries[row[0]] = CachedProfile(int(row[1]), row[2], int(row[3]))
+    return cache
+
+
+def update_profile_cache_csv(cache: ProfileCache) -> None:
+    _write_rows(
+        PROFILES_PATH,
+        PROFILES_HEADER,
+        [
+            (username, entry.fetched, entry.etag, entry.last_online)
+            for username, entry in sorted(cache.entries.items())
+        ],
+    )
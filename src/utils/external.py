@@ -0,0 +1,142 @@
+import csv
+import heapq
+import os
+import tempfile
+from typing import Callable, Iterable, Iterator, Optional
+
+from .structures import Member
+
+# members held in memory at once while spilling to disk
+RUN_SIZE = 50_000
+
+_Row = tuple[str, str, str, str]
+
+
+def _to_row(member: Member) -> _Row:
+    return (
+        member.username,
+        str(member.player_id or 0),
+        str(member.joined or 0),
+        "1" if member.is_active else "0",
+    )
+
+
+def _from_row(row: list[str]) -> Member:
+    return Member(
+        username=row[0],
+        player_id=int(row[1]) or None,
+        joined=int(row[2]) or None,
+        is_active=row[3] == "1",
+    )
+
+
+def _read_run(path: str) -> Iterator[Member]:
+    with open(path, newline="") as stream:
+        for row in csv.reader(stream):
+            yield _from_row(row)
+
+
+def iter_sorted(
+    members: Iterable[Member],
+    key: Callable[[Member], object],
+    dir: str,
+    run_size: int = RUN_SIZE,
+) -> Iterator[Member]:
+    """sorts members of any number by spilling sorted runs of `run_size`
+    into `dir` and merging them, so that memory use stays bounded.
+    `members` is used up before this returns, so the result can be
+    written back to where `members` came from."""
+
+    paths: list[str] = []
+    run: list[Member] = []
+
+    def spill() -> None:
+        run.sort(key=key)
+        fd, path = tempfile.mkstemp(suffix=".csv", dir=dir)
+        with os.fdopen(fd, "w", newline="") as stream:
+            csv.writer(stream).writerows(_to_row(member) for member in run)
+        paths.append(path)
+        run.clear()
+
+    for member in members:
+        run.append(member)
+        if len(run) >= run_size:
+            spill()
+    if run:
+        spill()
+    return heapq.merge(*(_read_run(path) for path in paths), key=key)
+
+
+def _by_username(member: Member) -> str:
+    return member.username
+
+
+def diff_sorted(
+    existing: Iterator[Member], incoming: Iterator[Member]
+) -> tuple[list[Member], list[Member]]:
+    """same as `_diff_members`, for streams sorted by username,
+    holding only the changes in memory"""
+
+    additions: list[Member] = []
+    deletions: list[Member] = []
+    old: Optional[Member] = next(existing, None)
+    new: Optional[Member] = next(incoming, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old.username < new.username):
+            assert old is not None
+            deletions.append(old)
+            old = next(existing, None)
+        elif old is None or new.username < old.username:
+            additions.append(new)
+            new = next(incoming, None)
+        else:
+            if old.joined != new.joined:
+                additions.append(new)
+                deletions.append(old)
+            old = next(existing, None)
+            new = next(incoming, None)
+    return additions, deletions
+
+
+def external_diff(
+    existing: Iterable[Member],
+    incoming: Iterable[Member],
+    dir: str,
+    run_size: int = RUN_SIZE,
+) -> tuple[list[Member], list[Member]]:
+    """additions and deletions between current members on record and
+    incoming members, sorting both on disk"""
+
+    return diff_sorted(
+        iter_sorted(existing, _by_username, dir, run_size),
+        iter_sorted(incoming, _by_username, dir, run_size),
+    )
+
+
+def merge_changes(
+    members: Iterable[Member],
+    changed: dict[int, Member],
+    dir: str,
+    run_size: int = RUN_SIZE,
+) -> Iterator[Member]:
+    """members on record with `changed` ones replaced or added by
+    player_id, in the order of the members csv"""
+
+    def updated() -> Iterator[Member]:
+        seen: set[int] = set()
+        for member in members:
+            if member.player_id in changed:
+                seen.add(member.player_id)
+                yield changed[member.player_id]
+            else:
+                yield member
+        for player_id, member in changed.items():
+            if player_id not in seen:
+                yield member
+
+    return iter_sorted(
+        updated(),
+        lambda member: (not member.is_active, member.username),
+        dir,
+        run_size,
+    )
@@ -1,8 +1,41 @@
 import re
-from typing import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, TypeVar
 
-from .csv_utils import get_existing_members_from_csv, update_members_csv
-from .structures import Member, MemberRecords
+from .csv_utils import (
+    append_journal_csv,
+    append_request_log_csv,
+    get_club_index_from_csv,
+    get_existing_members_from_csv,
+    get_journal_entries_from_csv,
+    get_profile_cache_from_csv,
+    get_request_log_from_csv,
+    get_rollups_from_csv,
+    get_stats_cache_from_csv,
+    get_timeout_watches_from_csv,
+    iter_existing_members_from_csv,
+    remove_journal_csv,
+    update_club_index_csv,
+    update_members_csv,
+    update_profile_cache_csv,
+    update_rollups_csv,
+    update_stats_cache_csv,
+    update_timeout_watches_csv,
+    write_members_csv,
+)
+from .indexes import ClubIndex
+from .structures import (
+    Member,
+    MemberRecords,
+    MembershipRollups,
+    ProfileCache,
+    RequestLogEntry,
+    StatsCache,
+    TimeoutWatch,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 # this allows for seamless transition from csv to database
@@ -19,6 +52,93 @@ def updated_members_data(club_name: str, record: MemberRecords):
     return update_members_csv(club_name, record)
 
 
+# this allows for seamless transition from csv to database
+def iter_existing_members(club_name: str) -> Iterator[Member]:
+    return iter_existing_members_from_csv(club_name)
+
+
+# this allows for seamless transition from csv to database
+def write_members_data(club_name: str, members: Iterable[Member]):
+    return write_members_csv(club_name, members)
+
+
+# this allows for seamless transition from csv to database
+def get_rollups(club_name: str) -> MembershipRollups:
+    return get_rollups_from_csv(club_name)
+
+
+# this allows for seamless transition from csv to database
+def updated_rollups_data(club_name: str, rollups: MembershipRollups):
+    return update_rollups_csv(club_name, rollups)
+
+
+# this allows for seamless transition from csv to database
+def get_stats_cache() -> StatsCache:
+    return get_stats_cache_from_csv()
+
+
+# this allows for seamless transition from csv to database
+def updated_stats_cache(cache: StatsCache):
+    return update_stats_cache_csv(cache)
+
+
+# this allows for seamless transition from csv to database
+def get_profile_cache() -> ProfileCache:
+    return get_profile_cache_from_csv()
+
+
+# this allows for seamless transition from csv to database
+def updated_profile_cache(cache: ProfileCache):
+    return update_profile_cache_csv(cache)
+
+
+# this allows for seamless transition from csv to database
+def get_timeout_watches(club_name: str) -> dict[str, TimeoutWatch]:
+    return get_timeout_watches_from_csv(club_name)
+
+
+# this allows for seamless transition from csv to database
+def updated_timeout_watches(club_name: str, watches: dict[str, TimeoutWatch]):
+    return update_timeout_watches_csv(club_name, watches)
+
+
+# this allows for seamless transition from csv to database
+def get_club_index(max_age: int) -> ClubIndex:
+    index = get_club_index_from_csv()
+    index.max_age = max_age
+    return index
+
+
+# this allows for seamless transition from csv to database
+def updated_club_index(index: ClubIndex):
+    return update_club_index_csv(index)
+
+
+# this allows for seamless transition from csv to database
+def get_request_log() -> list[RequestLogEntry]:
+    return get_request_log_from_csv()
+
+
+# this allows for seamless transition from csv to database
+def log_requests(entry: RequestLogEntry) -> None:
+    return append_request_log_csv(entry)
+
+
+# this allows for seamless transition from csv to database
+def get_journal_entries() -> list[tuple[str, str, str, str]]:
+    return get_journal_entries_from_csv()
+
+
+# this allows for seamless transition from csv to database
+def add_journal_entry(entry: tuple[str, str, str, str]) -> None:
+    return append_journal_csv(entry)
+
+
+# this allows for seamless transition from csv to database
+def clear_journal() -> None:
+    return remove_journal_csv()
+
+
 def get_player_id_map(members: Iterable[Member]) -> dict[int, Member]:
     player_id_map: dict[int, Member] = {}
     for member in members:
@@ -34,6 +154,23 @@ def get_username_map(members: Iterable[Member]) -> dict[str, Member]:
     return username_map
 
 
+def map_concurrently(
+    fn: Callable[[T], R], items: Iterable[T], max_workers: int
+) -> Iterator[tuple[T, "Future[R]"]]:
+    """calls `fn` on items in a thread pool, yielding each item with its
+    finished future as soon as it completes. pending calls are cancelled
+    if the caller stops early."""
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fn, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future
+        finally:
+            for future in futures:
+                future.cancel()
+
+
 def validate_email(email: str) -> bool:
     pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
     if re.match(pattern, email):
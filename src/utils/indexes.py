@@ -0,0 +1,134 @@
+import time
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Mapping, Optional
+
+from .structures import _MatchSettings, _PlayerGameTypeStats, _PlayerStats
+
+
+class RatingIndex:
+    """players sorted by rating for each rules and time class,
+    so that rating range queries take logarithmic time"""
+
+    def __init__(self, stats: Mapping[str, _PlayerStats]) -> None:
+        entries: dict[str, list[tuple[int, str, int]]] = {}
+        for username, player_stats in stats.items():
+            for variant in ("chess_daily", "chess960_daily"):
+                game_type: Optional[_PlayerGameTypeStats] = getattr(
+                    player_stats, variant
+                )
+                if game_type is None:
+                    continue
+                record = game_type.record
+                games = record.wins + record.draws + record.losses
+                entries.setdefault(variant, []).append(
+                    (game_type.last.rating, username, games)
+                )
+        self._entries = {
+            variant: sorted(rows) for variant, rows in entries.items()
+        }
+        self._ratings = {
+            variant: [row[0] for row in rows]
+            for variant, rows in self._entries.items()
+        }
+
+    @staticmethod
+    def _variant(rules: str, time_class: str) -> str:
+        return f"{rules}_{time_class}"
+
+    def query(
+        self,
+        rules: str,
+        time_class: str,
+        min_rating: Optional[int] = None,
+        max_rating: Optional[int] = None,
+        min_games: Optional[int] = None,
+    ) -> list[str]:
+        """usernames rated within the range, in ascending order of rating"""
+
+        variant = self._variant(rules, time_class)
+        ratings = self._ratings.get(variant, [])
+        start = 0 if min_rating is None else bisect_left(ratings, min_rating)
+        end = (
+            len(ratings)
+            if max_rating is None
+            else bisect_right(ratings, max_rating)
+        )
+        if end <= start:
+            return []
+        return [
+            username
+            for _, username, games in self._entries[variant][start:end]
+            if not min_games or games >= min_games
+        ]
+
+    def eligible(self, settings: _MatchSettings) -> list[str]:
+        return self.query(
+            settings.rules,
+            settings.time_class,
+            settings.min_rating,
+            settings.max_rating,
+            settings.min_required_games,
+        )
+
+
+class ClubIndex:
+    """which tracked clubs each player belongs to, built from the member
+    lists we fetch. only lists fetched within `max_age` seconds are used
+    to answer questions."""
+
+    def __init__(self, max_age: int = 86400) -> None:
+        self.max_age = max_age
+        self.members: dict[str, set[str]] = {}
+        self.clubs: dict[str, set[str]] = {}
+        self.updated: dict[str, int] = {}
+        # clubs whose lists were fetched since the index was loaded
+        self.fetched: set[str] = set()
+
+    def update_club(
+        self,
+        club_name: str,
+        usernames: Iterable[str],
+        timestamp: Optional[int] = None,
+    ) -> None:
+        """replaces a club's member list, touching only players who
+        joined or left since the last update"""
+
+        incoming = {username.lower() for username in usernames}
+        existing = self.members.get(club_name, set())
+        for username in existing - incoming:
+            clubs = self.clubs[username]
+            clubs.discard(club_name)
+            if not clubs:
+                del self.clubs[username]
+        for username in incoming - existing:
+            self.clubs.setdefault(username, set()).add(club_name)
+        self.members[club_name] = incoming
+        if timestamp is None:
+            timestamp = int(time.time())
+            self.fetched.add(club_name)
+        self.updated[club_name] = timestamp
+
+    def tracks(self, club_name: str) -> bool:
+        updated = self.updated.get(club_name)
+        return updated is not None and updated >= time.time() - self.max_age
+
+    def clubs_of(self, username: str, since: Optional[int] = None) -> set[str]:
+        """tracked clubs the player is in, a subset of all their clubs.
+        with `since`, only clubs whose lists were fetched at or after it,
+        or since the index was loaded, are counted."""
+        return {
+            club_name
+            for club_name in self.clubs.get(username.lower(), ())
+            if self.tracks(club_name)
+            and (
+                since is None
+                or self.updated[club_name] >= since
+                or club_name in self.fetched
+            )
+        }
+
+    def is_member(self, username: str, club_name: str) -> Optional[bool]:
+        """`None` if the club isn't tracked"""
+        if not self.tracks(club_name):
+            return None
+        return username.lower() in self.members[club_name]
@@ -0,0 +1,113 @@
+from typing import Optional
+
+from .functions import add_journal_entry, clear_journal, get_journal_entries
+from .structures import Member
+
+# kinds of journal entries
+_RUN = "run"
+_CLUB = "club"
+_PLAYER_ID = "player_id"
+_DEPARTURE = "departure"
+_CANDIDATE = "candidate"
+
+# outcomes of looking up a departed member's clubs
+CLOSED = "closed"
+LEFT = "left"
+UNKNOWN = "unknown"
+
+
+class RunJournal:
+    """persistent record of work done by a run, written as the run goes,
+    so that an interrupted run can be resumed without redoing requests"""
+
+    def __init__(
+        self, entries: Optional[list[tuple[str, str, str, str]]] = None
+    ) -> None:
+        self.options: dict[str, str] = {}
+        self.completed: set[str] = set()
+        self.player_ids: dict[str, int] = {}
+        self.departures: dict[tuple[str, str], str] = {}
+        self.candidates: dict[tuple[str, str], bool] = {}
+        for kind, club_name, key, value in entries or ():
+            self._apply(kind, club_name, key, value)
+
+    @staticmethod
+    def _options(club_names: list[str], readonly: bool) -> dict[str, str]:
+        return {"clubs": ",".join(club_names), "readonly": str(int(readonly))}
+
+    @staticmethod
+    def start(club_names: list[str], readonly: bool) -> "RunJournal":
+        """starts an empty journal, discarding any unfinished run"""
+        clear_journal()
+        journal = RunJournal()
+        for key, value in RunJournal._options(club_names, readonly).items():
+            journal._add(_RUN, "", key, value)
+        return journal
+
+    @staticmethod
+    def resume() -> "RunJournal":
+        return RunJournal(get_journal_entries())
+
+    @staticmethod
+    def finish() -> None:
+        clear_journal()
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.options
+
+    @property
+    def readonly(self) -> bool:
+        return self.options.get("readonly") == "1"
+
+    def matches(self, club_names: list[str], readonly: bool) -> bool:
+        """whether the journal is of a run with the same options"""
+        return self.options == self._options(club_names, readonly)
+
+    def _apply(self, kind: str, club_name: str, key: str, value: str) -> None:
+        if kind == _RUN:
+            self.options[key] = value
+        elif kind == _CLUB:
+            self.completed.add(club_name)
+        elif kind == _PLAYER_ID:
+            self.player_ids[key] = int(value)
+        elif kind == _DEPARTURE:
+            self.departures[(club_name, key)] = value
+        elif kind == _CANDIDATE:
+            self.candidates[(club_name, key)] = value == "1"
+
+    def _add(self, kind: str, club_name: str, key: str, value: str) -> None:
+        self._apply(kind, club_name, key, value)
+        add_journal_entry((kind, club_name, key, value))
+
+    @staticmethod
+    def _member_key(member: Member) -> str:
+        return f"{member.username}:{member.joined}"
+
+    def is_complete(self, club_name: str) -> bool:
+        return club_name in self.completed
+
+    def complete(self, club_name: str) -> None:
+        self._add(_CLUB, club_name, "", "")
+
+    def player_id(self, member: Member) -> Optional[int]:
+        return self.player_ids.get(self._member_key(member))
+
+    def add_player_id(self, member: Member) -> None:
+        if member.player_id:
+            key = self._member_key(member)
+            self._add(_PLAYER_ID, "", key, str(member.player_id))
+
+    def departure(self, club_name: str, member: Member) -> Optional[str]:
+        """`CLOSED`, `LEFT` or `UNKNOWN` if the member was looked up"""
+        return self.departures.get((club_name, str(member.player_id)))
+
+    def add_departure(self, club_name: str, member: Member, outcome: str):
+        self._add(_DEPARTURE, club_name, str(member.player_id), outcome)
+
+    def candidate(self, club_name: str, username: str) -> Optional[bool]:
+        """whether an evaluated candidate passed, `None` if not evaluated"""
+        return self.candidates.get((club_name, username))
+
+    def add_candidate(self, club_name: str, username: str, passed: bool):
+        self._add(_CANDIDATE, club_name, username, "1" if passed else "0")
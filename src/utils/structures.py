@@ -1,5 +1,7 @@
+import time
 from dataclasses import dataclass, field
-from typing import Any, Iterable, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Iterator, Optional
 
 import dataclass_wizard as dw
 import requests
@@ -29,6 +31,19 @@ def _get_data(session: requests.Session, url: str, timeout: int = 5):
     return data
 
 
+def _get_data_if_modified(
+    session: requests.Session, url: str, etag: Optional[str], timeout: int = 5
+) -> tuple[Any, Optional[str]]:
+    """gets data and its etag, data is `None` if unchanged since `etag`"""
+
+    headers = {"If-None-Match": etag} if etag else {}
+    response = session.get(url, timeout=timeout, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    response.raise_for_status()
+    return response.json(), response.headers.get("ETag")
+
+
 # data structures
 
 
@@ -62,6 +77,26 @@ class _PlayerStats(dw.JSONWizard):
     chess960_daily: Optional[_PlayerGameTypeStats] = None
 
 
+@dataclass
+class _OngoingGame(dw.JSONWizard):
+    url: str
+    turn: str
+    white: str
+    black: str
+    move_by: int = 0
+    time_class: str = "daily"
+    match: Optional[str] = None
+
+    def to_move(self, username: str) -> bool:
+        player = self.white if self.turn == "white" else self.black
+        return player.lower().endswith(f"/{username.lower()}")
+
+
+@dataclass
+class _OngoingGames(dw.JSONWizard):
+    games: list[_OngoingGame]
+
+
 @dataclass
 class _Player(dw.JSONWizard):
     username: str
@@ -78,6 +113,13 @@ class _Player(dw.JSONWizard):
             data = _get_data(session, self.api)
             self.player_id = Member.from_dict(data).player_id
 
+    def get_profile_if_modified(
+        self, session: requests.Session, etag: Optional[str]
+    ) -> tuple[Optional["_PlayerProfile"], Optional[str]]:
+        """profile is `None` if unchanged since `etag`"""
+        data, etag = _get_data_if_modified(session, self.api, etag)
+        return (None if data is None else _PlayerProfile.from_dict(data)), etag
+
     @property
     def url(self) -> str:
         return f"https://www.chess.com/member/{self.username}"
@@ -107,10 +149,24 @@ class _Player(dw.JSONWizard):
     def api_games(self) -> str:
         return f"{self.api}/games"
 
+    def get_ongoing_games(
+        self, session: requests.Session
+    ) -> list[_OngoingGame]:
+        return _OngoingGames.from_dict(
+            _get_data(session, self.api_games)
+        ).games
+
     def api_archive(self, year: int, month: int) -> str:
         return f"{self.api}/games/archive/{year}/{month}"
 
 
+@dataclass
+class _PlayerProfile(_Player):
+    last_online: Optional[int] = field(
+        default=None, metadata=_remap("last_online")
+    )
+
+
 @dataclass
 class _ClubMembers(dw.JSONWizard):
     weekly: list["Member"]
@@ -181,7 +237,8 @@ class _MatchTeams(dw.JSONWizard):
 class _GamePlayer(dw.JSONWizard):
     api: str = field(metadata=_remap("@id"))
     username: str
-    result: str
+    result: Optional[str] = None
+    rating: Optional[int] = None
 
 
 @dataclass
@@ -191,14 +248,14 @@ class _Game(dw.JSONWizard):
     white: _GamePlayer
     black: _GamePlayer
     start_time: int
-    end_time: Optional[int]
+    end_time: Optional[int] = None
 
 
 @dataclass
 class Board(dw.JSONWizard):
     """class that represents boards, initialise with `from_str()`"""
 
-    board_scores: dict[str, int]
+    board_scores: dict[str, float]
     games: list[_Game]
 
     @staticmethod
@@ -206,6 +263,15 @@ class Board(dw.JSONWizard):
         """gets `Board` object from api url"""
         return Board.from_dict(_get_data(session, s))
 
+    @staticmethod
+    def from_str_if_modified(
+        session: requests.Session, s: str, etag: Optional[str]
+    ) -> tuple[Optional["Board"], Optional[str]]:
+        """gets `Board` object from api url unless it's unchanged since
+        `etag`, in which case the board is `None`"""
+        data, etag = _get_data_if_modified(session, s, etag)
+        return (None if data is None else Board.from_dict(data)), etag
+
 
 @dataclass
 class Match(dw.JSONWizard):
@@ -276,6 +342,17 @@ class Club(dw.JSONWizard):
         data = _get_data(session, self.api_members)
         return _ClubMembers.from_dict(data).all
 
+    def iter_members(self, session: requests.Session) -> Iterator[Member]:
+        """yields club members one at a time, letting go of each one's
+        data as it goes. the response itself is parsed and held in full,
+        so memory still grows with the size of the club."""
+        data = _get_data(session, self.api_members)
+        for key in ("weekly", "monthly", "all_time"):
+            section: list[dict] = data.get(key, [])
+            section.reverse()
+            while section:
+                yield Member.from_dict(section.pop())
+
     @property
     def api_matches(self) -> str:
         return f"{self.api}/matches"
@@ -324,6 +401,19 @@ class _RecruitmentConfigs(dw.JSONWizard):
     max_hrs_offline: int = 48
 
 
+@dataclass
+class _BudgetConfigs(dw.JSONWizard):
+    max_requests_per_run: Optional[int] = None
+    max_requests_per_hour: Optional[int] = None
+
+
+@dataclass
+class _CacheConfigs(dw.JSONWizard):
+    stats_expiry: int = 24
+    index_expiry: int = 24
+    profile_expiry: int = 24
+
+
 @dataclass
 class ClubConfig(dw.JSONWizard):
     recruitment: _RecruitmentConfigs
@@ -337,6 +427,8 @@ class Configs(dw.JSONWizard):
     club_configs: dict[str, ClubConfig] = field(
         metadata=_remap("club_configs"), default_factory=dict
     )
+    budget: _BudgetConfigs = field(default_factory=_BudgetConfigs)
+    cache: _CacheConfigs = field(default_factory=_CacheConfigs)
 
     def __post_init__(self):
         if self.all_club_names and not self.default_club_name:
@@ -399,3 +491,205 @@ class MemberRecords:
     @property
     def all(self) -> list[Member]:
         return sorted(self.current.values()) + sorted(self.archive.values())
+
+
+class StatsCache:
+    """player stats by username with the time they were fetched"""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, tuple[int, _PlayerStats]] = {}
+
+    def get(self, username: str, max_age: int) -> Optional[_PlayerStats]:
+        """returns stats fetched less than `max_age` seconds ago"""
+        entry = self.entries.get(username.lower())
+        if entry is None or entry[0] < time.time() - max_age:
+            return None
+        return entry[1]
+
+    def set(
+        self, username: str, stats: _PlayerStats, fetched: Optional[int] = None
+    ) -> None:
+        fetched = int(time.time()) if fetched is None else fetched
+        self.entries[username.lower()] = (fetched, stats)
+
+    def fresh(self, max_age: int) -> dict[str, _PlayerStats]:
+        cutoff = time.time() - max_age
+        return {
+            username: stats
+            for username, (fetched, stats) in self.entries.items()
+            if fetched >= cutoff
+        }
+
+
+@dataclass
+class CachedProfile:
+    fetched: int
+    etag: str = ""
+    last_online: int = 0
+
+
+class ProfileCache:
+    """last online times by username, with when and which version
+    of the profile they came from"""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, CachedProfile] = {}
+
+    def get(self, username: str) -> Optional[CachedProfile]:
+        return self.entries.get(username.lower())
+
+    def is_fresh(self, username: str, max_age: int) -> bool:
+        entry = self.get(username)
+        return entry is not None and entry.fetched >= time.time() - max_age
+
+    def set(
+        self, username: str, etag: Optional[str], last_online: Optional[int]
+    ) -> None:
+        self.entries[username.lower()] = CachedProfile(
+            int(time.time()), etag or "", last_online or 0
+        )
+
+
+@dataclass
+class TimeoutWatch:
+    """when to check a member's games next, and the earliest deadline
+    of a club match game where it was their move when last checked"""
+
+    username: str
+    next_poll: int = 0
+    deadline: int = 0
+    game: str = ""
+
+
+@dataclass
+class RequestLogEntry:
+    """number of api requests made by one task of one run"""
+
+    timestamp: int
+    club_name: str
+    task: str
+    requests: int
+    size: int = 0
+
+
+@dataclass
+class _Rollup:
+    joins: int = 0
+    departures: int = 0
+    closures: int = 0
+    returns: int = 0
+    active: int = 0
+
+    @property
+    def net(self) -> int:
+        return self.joins + self.returns - self.departures - self.closures
+
+
+@dataclass
+class _Cohort:
+    joined: int = 0
+    departed: int = 0
+
+    @property
+    def churn_rate(self) -> float:
+        return self.departed / self.joined if self.joined else 0.0
+
+
+class MembershipRollups:
+    """daily and weekly membership change counts, churn per join cohort
+    (month of joining) and a histogram of goners' tenures in days"""
+
+    def __init__(self) -> None:
+        self.daily: dict[str, _Rollup] = {}
+        self.weekly: dict[str, _Rollup] = {}
+        self.cohorts: dict[str, _Cohort] = {}
+        self.tenures: dict[int, int] = {}
+
+    @staticmethod
+    def _day(timestamp: int) -> str:
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+            "%Y-%m-%d"
+        )
+
+    @staticmethod
+    def _week(timestamp: int) -> str:
+        day = datetime.fromtimestamp(timestamp, timezone.utc).date()
+        return (day - timedelta(days=day.weekday())).isoformat()
+
+    @staticmethod
+    def _cohort(member: Member) -> str:
+        return datetime.fromtimestamp(
+            member.joined or 0, timezone.utc
+        ).strftime("%Y-%m")
+
+    def _periods(self, timestamp: int) -> tuple[_Rollup, _Rollup]:
+        day = self.daily.setdefault(self._day(timestamp), _Rollup())
+        week = self.weekly.setdefault(self._week(timestamp), _Rollup())
+        return day, week
+
+    def seed_cohorts(self, members: Iterable[Member]) -> None:
+        """fills cohorts from existing records, for clubs with no history"""
+        for member in members:
+            cohort = self.cohorts.setdefault(self._cohort(member), _Cohort())
+            cohort.joined += 1
+            if not member.is_active:
+                cohort.departed += 1
+
+    def add_joins(self, timestamp: int, members: Iterable[Member]) -> None:
+        for member in members:
+            for period in self._periods(timestamp):
+                period.joins += 1
+            self.cohorts.setdefault(
+                self._cohort(member), _Cohort()
+            ).joined += 1
+
+    def add_departures(
+        self, timestamp: int, members: Iterable[Member], closed: bool = False
+    ) -> None:
+        for member in members:
+            for period in self._periods(timestamp):
+                if closed:
+                    period.closures += 1
+                else:
+                    period.departures += 1
+            self.cohorts.setdefault(
+                self._cohort(member), _Cohort()
+            ).departed += 1
+            if not closed and member.joined:
+                days = (timestamp - member.joined) // 86400
+                self.tenures[days] = self.tenures.get(days, 0) + 1
+
+    def add_returns(
+        self, timestamp: int, members: Iterable[Member], rejoined: bool
+    ) -> None:
+        """`rejoined` members come back with a new join time,
+        the others reopened their accounts and keep their old one"""
+        for member in members:
+            for period in self._periods(timestamp):
+                period.returns += 1
+            cohort = self.cohorts.setdefault(self._cohort(member), _Cohort())
+            if rejoined:
+                cohort.joined += 1
+            elif cohort.departed:
+                # the departure may predate the rollups
+                cohort.departed -= 1
+
+    def set_active(self, timestamp: int, active: int) -> None:
+        for period in self._periods(timestamp):
+            period.active = active
+
+    @property
+    def median_tenure(self) -> Optional[float]:
+        """median tenure of goners in days"""
+        total = sum(self.tenures.values())
+        if not total:
+            return None
+        middle: list[int] = []
+        seen = 0
+        for days in sorted(self.tenures):
+            count = self.tenures[days]
+            for index in ((total - 1) // 2, total // 2):
+                if seen <= index < seen + count:
+                    middle.append(days)
+            seen += count
+        return sum(middle) / len(middle)
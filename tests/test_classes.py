@@ -0,0 +1,594 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.commands.matches import (
+    _MAX_BOARD_INTERVAL,
+    _MIN_BOARD_INTERVAL,
+    _expected_score,
+    _MatchTracker,
+)
+from src.utils.budget import (
+    MEMBERSHIP,
+    RECRUITMENT,
+    RequestBudget,
+    RequestPlanner,
+)
+from src.utils.indexes import ClubIndex, RatingIndex
+from src.utils.journal import CLOSED, RunJournal
+from src.utils.structures import (
+    Board,
+    Configs,
+    Match,
+    Member,
+    MembershipRollups,
+    RequestLogEntry,
+    _Game,
+    _GamePlayer,
+    _MatchSettings,
+    _PlayerStats,
+)
+
+
+class TestRequestBudget(unittest.TestCase):
+    def test_unlimited(self):
+        self.assertIsNone(RequestBudget().remaining)
+
+    def test_per_run(self):
+        budget = RequestBudget(per_run=3)
+        budget.used = 2
+        self.assertEqual(budget.remaining, 1)
+
+    def test_per_hour_counts_recent(self):
+        budget = RequestBudget(per_hour=10, recent=7)
+        budget.used = 2
+        self.assertEqual(budget.remaining, 1)
+
+    def test_tighter_limit_wins(self):
+        self.assertEqual(RequestBudget(5, 10, 8).remaining, 2)
+        self.assertEqual(RequestBudget(1, 10, 0).remaining, 1)
+
+    def test_never_negative(self):
+        self.assertEqual(RequestBudget(per_hour=10, recent=15).remaining, 0)
+
+    def test_from_configs(self):
+        configs = Configs.from_dict(
+            {
+                "budget": {
+                    "max_requests_per_run": 50,
+                    "max_requests_per_hour": 100,
+                }
+            }
+        )
+        now = int(time.time())
+        log = [
+            RequestLogEntry(now - 60, "club", MEMBERSHIP, 30),
+            RequestLogEntry(now - 7200, "club", MEMBERSHIP, 500),
+        ]
+        budget = RequestBudget.from_configs(configs, log)
+        self.assertEqual(budget.per_run, 50)
+        self.assertEqual(budget.recent, 30)
+        self.assertEqual(budget.remaining, 50)
+        self.assertEqual(
+            RequestBudget.from_configs(configs, log, 10).remaining, 10
+        )
+
+    def test_zero_override(self):
+        configs = Configs.from_dict({"budget": {"max_requests_per_run": 50}})
+        budget = RequestBudget.from_configs(configs, [], 0)
+        self.assertEqual(budget.per_run, 0)
+        self.assertEqual(budget.remaining, 0)
+
+
+class TestRequestPlanner(unittest.TestCase):
+    def test_priority_order(self):
+        planner = RequestPlanner()
+        planner.add(RECRUITMENT, "unlikely", 1, 0.2)
+        planner.add(MEMBERSHIP, "club", 1)
+        planner.add(RECRUITMENT, "likely", 1, 0.9)
+        admitted, deferred = planner.schedule(None)
+        self.assertEqual(
+            [task.name for task in admitted], ["club", "likely", "unlikely"]
+        )
+        self.assertEqual(deferred, [])
+
+    def test_defers_tasks_that_dont_fit(self):
+        planner = RequestPlanner()
+        planner.add(MEMBERSHIP, "big", 8)
+        planner.add(MEMBERSHIP, "small", 2)
+        planner.add(RECRUITMENT, "candidate", 3)
+        planner.add(RECRUITMENT, "cheap", 1, 0.5)
+        admitted, deferred = planner.schedule(11)
+        self.assertEqual(
+            [task.name for task in admitted], ["big", "small", "cheap"]
+        )
+        self.assertEqual([task.name for task in deferred], ["candidate"])
+        self.assertEqual(planner.total, 14)
+
+    def test_exact_fit(self):
+        planner = RequestPlanner()
+        planner.add(MEMBERSHIP, "club", 5)
+        self.assertEqual(len(planner.schedule(5)[0]), 1)
+        self.assertEqual(len(planner.schedule(4)[1]), 1)
+
+    def test_per_hour_limit(self):
+        planner = RequestPlanner()
+        planner.add(MEMBERSHIP, "first", 4)
+        planner.add(MEMBERSHIP, "second", 4)
+        budget = RequestBudget(per_hour=10, recent=3)
+        admitted, deferred = planner.schedule(budget.remaining)
+        self.assertEqual([task.name for task in admitted], ["first"])
+        self.assertEqual([task.name for task in deferred], ["second"])
+
+
+def _timestamp(year: int, month: int, day: int) -> int:
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp())
+
+
+class TestMembershipRollups(unittest.TestCase):
+    def setUp(self):
+        self.rollups = MembershipRollups()
+        # a wednesday
+        self.now = _timestamp(2024, 3, 13)
+        self.member = Member("someone", 1, _timestamp(2024, 1, 3))
+
+    def cohort(self, key: str = "2024-01") -> tuple[int, int]:
+        cohort = self.rollups.cohorts[key]
+        return cohort.joined, cohort.departed
+
+    def test_join(self):
+        self.rollups.add_joins(self.now, [self.member])
+        self.assertEqual(self.cohort(), (1, 0))
+        self.assertEqual(self.rollups.daily["2024-03-13"].joins, 1)
+        self.assertEqual(self.rollups.weekly["2024-03-11"].joins, 1)
+
+    def test_leave(self):
+        self.rollups.add_joins(self.now, [self.member])
+        self.rollups.add_departures(self.now, [self.member])
+        self.assertEqual(self.cohort(), (1, 1))
+        self.assertEqual(self.rollups.cohorts["2024-01"].churn_rate, 1.0)
+        self.assertEqual(self.rollups.daily["2024-03-13"].net, 0)
+        # joined on 3 january, left on 13 march
+        self.assertEqual(self.rollups.tenures, {70: 1})
+
+    def test_close_and_reopen(self):
+        self.rollups.seed_cohorts([self.member])
+        self.rollups.add_departures(self.now, [self.member], closed=True)
+        self.assertEqual(self.cohort(), (1, 1))
+        self.assertEqual(self.rollups.daily["2024-03-13"].closures, 1)
+        # closures aren't goners
+        self.assertEqual(self.rollups.tenures, {})
+        self.rollups.add_returns(self.now, [self.member], rejoined=False)
+        self.assertEqual(self.cohort(), (1, 0))
+        self.assertEqual(self.rollups.daily["2024-03-13"].returns, 1)
+        self.assertEqual(self.rollups.daily["2024-03-13"].net, 0)
+
+    def test_reopen_without_departure(self):
+        self.rollups.add_joins(self.now, [self.member])
+        self.rollups.add_returns(self.now, [self.member], rejoined=False)
+        self.assertEqual(self.cohort(), (1, 0))
+
+    def test_return(self):
+        self.rollups.seed_cohorts([self.member])
+        self.rollups.add_departures(self.now, [self.member])
+        later = self.now + 30 * 86400
+        returned = Member("someone", 1, later)
+        self.rollups.add_returns(later, [returned], rejoined=True)
+        # the old cohort keeps its departure, the new one gains a joiner
+        self.assertEqual(self.cohort(), (1, 1))
+        self.assertEqual(self.cohort("2024-04"), (1, 0))
+        self.assertEqual(self.rollups.weekly["2024-04-08"].returns, 1)
+
+    def test_seed_cohorts(self):
+        self.rollups.seed_cohorts(
+            [
+                self.member,
+                Member("gone", 2, _timestamp(2024, 1, 20), False),
+                Member("other", 3, _timestamp(2024, 2, 1)),
+            ]
+        )
+        self.assertEqual(self.cohort(), (2, 1))
+        self.assertEqual(self.cohort("2024-02"), (1, 0))
+
+    def test_first_run_reseed(self):
+        # changes of the first run are already in the records it seeds from
+        gone = Member("gone", 2, _timestamp(2024, 1, 20))
+        self.rollups.add_departures(self.now, [gone])
+        gone.is_active = False
+        self.rollups.cohorts = {}
+        self.rollups.seed_cohorts([self.member, gone])
+        self.assertEqual(self.cohort(), (2, 1))
+        self.assertEqual(self.rollups.daily["2024-03-13"].departures, 1)
+
+    def test_set_active(self):
+        self.rollups.set_active(self.now, 42)
+        self.assertEqual(self.rollups.daily["2024-03-13"].active, 42)
+        self.assertEqual(self.rollups.weekly["2024-03-11"].active, 42)
+
+    def test_median_tenure(self):
+        self.assertIsNone(self.rollups.median_tenure)
+        self.rollups.tenures = {10: 1, 20: 1, 30: 1}
+        self.assertEqual(self.rollups.median_tenure, 20)
+        self.rollups.tenures = {10: 1, 20: 1, 30: 1, 40: 1}
+        self.assertEqual(self.rollups.median_tenure, 25)
+        self.rollups.tenures = {10: 3, 40: 1}
+        self.assertEqual(self.rollups.median_tenure, 10)
+        self.rollups.tenures = {10: 2, 40: 2}
+        self.assertEqual(self.rollups.median_tenure, 25)
+        self.rollups.tenures = {5: 1}
+        self.assertEqual(self.rollups.median_tenure, 5)
+
+
+def _stats(rating: int, games: int, variant: str = "chess_daily") -> dict:
+    return {
+        variant: {
+            "last": {"rating": rating},
+            "record": {
+                "win": games,
+                "draw": 0,
+                "loss": 0,
+                "time_per_move": 3600,
+                "timeout_percent": 0,
+            },
+        }
+    }
+
+
+class TestRatingIndex(unittest.TestCase):
+    def setUp(self):
+        stats = {
+            "low": _stats(1000, 50),
+            "edge_low": _stats(1200, 50),
+            "middle": _stats(1500, 5),
+            "edge_high": _stats(1800, 50),
+            "high": _stats(2100, 50),
+            "fischer": _stats(1600, 20, "chess960_daily"),
+        }
+        self.index = RatingIndex(
+            {
+                username: _PlayerStats.from_dict(data)
+                for username, data in stats.items()
+            }
+        )
+
+    def test_bounds_are_inclusive(self):
+        self.assertEqual(
+            self.index.query("chess", "daily", 1200, 1800),
+            ["edge_low", "middle", "edge_high"],
+        )
+
+    def test_bounds_between_ratings(self):
+        self.assertEqual(
+            self.index.query("chess", "daily", 1201, 1799), ["middle"]
+        )
+        self.assertEqual(self.index.query("chess", "daily", 1201, 1499), [])
+
+    def test_open_bounds(self):
+        self.assertEqual(
+            self.index.query("chess", "daily", None, 1200),
+            ["low", "edge_low"],
+        )
+        self.assertEqual(
+            self.index.query("chess", "daily", 1800, None),
+            ["edge_high", "high"],
+        )
+        self.assertEqual(len(self.index.query("chess", "daily")), 5)
+
+    def test_empty_range(self):
+        self.assertEqual(self.index.query("chess", "daily", 1900, 1100), [])
+
+    def test_min_games(self):
+        self.assertEqual(
+            self.index.query("chess", "daily", 1200, 1800, min_games=10),
+            ["edge_low", "edge_high"],
+        )
+        self.assertEqual(
+            self.index.query("chess", "daily", 1200, 1800, min_games=5),
+            ["edge_low", "middle", "edge_high"],
+        )
+
+    def test_variant_without_entries(self):
+        self.assertEqual(self.index.query("chess", "rapid", 1000, 2000), [])
+        self.assertEqual(RatingIndex({}).query("chess", "daily"), [])
+
+    def test_chess960_match(self):
+        settings = _MatchSettings(
+            "chess960", "daily", "1/259200", False, min_rating=1600
+        )
+        self.assertEqual(self.index.eligible(settings), ["fischer"])
+        settings.min_rating = 1601
+        self.assertEqual(self.index.eligible(settings), [])
+
+
+class TestClubIndex(unittest.TestCase):
+    def setUp(self):
+        self.now = int(time.time())
+        self.index = ClubIndex()
+        self.index.update_club("before", ["Someone"], self.now - 7200)
+        self.index.update_club("after", ["other"], self.now - 600)
+
+    def test_clubs_of(self):
+        self.assertEqual(self.index.clubs_of("someone"), {"before"})
+        self.assertEqual(self.index.clubs_of("nobody"), set())
+
+    def test_expired_lists_are_ignored(self):
+        self.index.max_age = 3600
+        self.assertEqual(self.index.clubs_of("someone"), set())
+
+    def test_since(self):
+        self.assertEqual(
+            self.index.clubs_of("other", self.now - 600), {"after"}
+        )
+        self.assertEqual(self.index.clubs_of("other", self.now - 599), set())
+
+    def test_fetched_in_this_run(self):
+        self.index.update_club("before", ["someone", "new"])
+        self.assertEqual(
+            self.index.clubs_of("someone", self.now + 60), {"before"}
+        )
+        self.assertEqual(self.index.clubs_of("other", self.now + 60), set())
+
+    def test_closure_after_other_clubs_list(self):
+        # yesterday's run listed x in both clubs, then x closed the account
+        index = ClubIndex()
+        index.update_club("a", ["x"], self.now - 86400)
+        index.update_club("b", ["x"], self.now - 86390)
+        # today a no longer lists x, while b's list is from before
+        index.update_club("a", [])
+        since = index.updated["a"]
+        self.assertEqual(index.clubs_of("x", since) - {"a"}, set())
+        # once b is fetched again in this run, its list can tell
+        index.update_club("b", ["x"])
+        self.assertEqual(index.clubs_of("x", since) - {"a"}, {"b"})
+
+    def test_update_club(self):
+        self.index.update_club("after", ["someone"])
+        self.assertEqual(self.index.clubs_of("other"), set())
+        self.assertEqual(self.index.clubs_of("someone"), {"before", "after"})
+        self.assertTrue(self.index.is_member("someone", "after"))
+        self.assertIsNone(self.index.is_member("someone", "untracked"))
+
+
+class TestRunJournal(unittest.TestCase):
+    def setUp(self):
+        # the journal is a csv file relative to the working directory
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        os.chdir(dir.name)
+
+    def test_resume_what_was_written(self):
+        journal = RunJournal.start(["a", "b"], False)
+        member = Member("someone", 1, 100)
+        journal.add_player_id(member)
+        journal.add_departure("a", member, CLOSED)
+        journal.complete("a")
+
+        resumed = RunJournal.resume()
+        self.assertTrue(resumed.matches(["a", "b"], False))
+        self.assertTrue(resumed.is_complete("a"))
+        self.assertFalse(resumed.is_complete("b"))
+        self.assertEqual(resumed.player_id(Member("someone", None, 100)), 1)
+        # a different join time is a different membership
+        self.assertIsNone(resumed.player_id(Member("someone", None, 200)))
+        self.assertEqual(resumed.departure("a", member), CLOSED)
+        self.assertIsNone(resumed.departure("b", member))
+
+    def test_matches_rejects_different_options(self):
+        RunJournal.start(["a", "b"], False)
+        resumed = RunJournal.resume()
+        self.assertFalse(resumed.matches(["a"], False))
+        self.assertFalse(resumed.matches(["b", "a"], False))
+        self.assertFalse(resumed.matches(["a", "b"], True))
+
+    def test_start_discards_the_previous_run(self):
+        RunJournal.start(["a"], False).complete("a")
+        RunJournal.start(["b"], False)
+        resumed = RunJournal.resume()
+        self.assertFalse(resumed.is_complete("a"))
+        self.assertTrue(resumed.matches(["b"], False))
+
+    def test_finish(self):
+        RunJournal.start(["a"], False).complete("a")
+        RunJournal.finish()
+        self.assertTrue(RunJournal.resume().is_empty)
+
+
+_POINTS = {"win": 1.0, "agreed": 0.5, "timeout": 0.0}
+
+
+class _FakeBoard:
+    """two games between a player of ours and an opponent, each either
+    ongoing or ended with `result` from our side"""
+
+    def __init__(self, number: int) -> None:
+        self.api = f"https://api.chess.com/pub/match/1/{number}"
+        self.ours = f"Ours{number}"
+        self.theirs = f"theirs{number}"
+        self.ratings = (1200 + 100 * number, 1500)
+        self.results: list[Optional[str]] = [None, None]
+
+    def player(self, ours: bool, result: Optional[str]) -> _GamePlayer:
+        username = self.ours if ours else self.theirs
+        return _GamePlayer(
+            f"https://api.chess.com/pub/player/{username}",
+            username,
+            result,
+            self.ratings[0 if ours else 1],
+        )
+
+    def board(self) -> Board:
+        games = []
+        scores = {self.ours: 0.0, self.theirs: 0.0}
+        for white_is_ours, result in zip((True, False), self.results):
+            ours = self.player(True, result)
+            theirs = self.player(False, None)
+            if result is not None:
+                scores[self.ours] += _POINTS[result]
+                scores[self.theirs] += 1 - _POINTS[result]
+            white, black = (ours, theirs) if white_is_ours else (theirs, ours)
+            games.append(
+                _Game(
+                    "https://www.chess.com/game/daily/1",
+                    "https://www.chess.com/club/matches/1",
+                    white,
+                    black,
+                    0,
+                    None if result is None else 1,
+                )
+            )
+        return Board(scores, games)
+
+    @property
+    def expected(self) -> float:
+        ongoing = sum(result is None for result in self.results)
+        return ongoing * _expected_score(*self.ratings)
+
+
+class TestMatchTracker(unittest.TestCase):
+    def setUp(self):
+        self.boards = [_FakeBoard(number) for number in range(1, 7)]
+        # the first two boards were over before tracking started
+        self.boards[0].results = ["win", "agreed"]
+        self.boards[1].results = ["timeout", "timeout"]
+        players = [
+            {
+                "username": board.ours,
+                "board": board.api,
+                "played_as_white": board.results[0],
+                "played_as_black": board.results[1],
+            }
+            for board in self.boards
+        ]
+        match = Match.from_dict(
+            {
+                "@id": "https://api.chess.com/pub/match/1",
+                "name": "friendly",
+                "url": "https://www.chess.com/club/matches/1",
+                "status": "in_progress",
+                "boards": len(self.boards),
+                "settings": {
+                    "rules": "chess",
+                    "time_class": "daily",
+                    "time_control": "1/259200",
+                    "autostart": False,
+                },
+                "teams": {
+                    "team1": {
+                        "@id": "https://api.chess.com/pub/club/ours",
+                        "name": "ours",
+                        "score": 0,
+                        "players": players,
+                    },
+                    "team2": {
+                        "@id": "https://api.chess.com/pub/club/theirs",
+                        "name": "theirs",
+                        "score": 0,
+                        "players": [],
+                    },
+                },
+            }
+        )
+        self.tracker = _MatchTracker(match, match.teams.team1)
+
+    def poll_all(self, now: int = 0) -> None:
+        for board in self.boards[2:]:
+            self.tracker.update(
+                self.tracker.boards[board.api], board.board(), now
+            )
+
+    def assert_recomputed(self) -> None:
+        """totals kept by deltas match totals from scratch,
+        once every board has been polled"""
+        score = sum(
+            _POINTS[result]
+            for board in self.boards
+            for result in board.results
+            if result is not None
+        )
+        finished = sum(
+            result is not None
+            for board in self.boards
+            for result in board.results
+        )
+        expected = sum(board.expected for board in self.boards)
+        self.assertAlmostEqual(self.tracker.score, score)
+        self.assertAlmostEqual(self.tracker.opponent_score, finished - score)
+        self.assertAlmostEqual(self.tracker.projected, score + expected)
+        self.assertAlmostEqual(
+            self.tracker.projected + self.tracker.opponent_projected,
+            2 * len(self.boards),
+        )
+        for board in self.boards:
+            state = self.tracker.boards[board.api]
+            self.assertEqual(state.finished, None not in board.results)
+
+    def test_settled_boards(self):
+        self.assertAlmostEqual(self.tracker.score, 1.5)
+        self.assertAlmostEqual(self.tracker.opponent_score, 2.5)
+        due = {board.api for board in self.tracker.due(0)}
+        self.assertEqual(due, {board.api for board in self.boards[2:]})
+
+    def test_first_poll(self):
+        self.poll_all()
+        self.assert_recomputed()
+
+    def test_half_points(self):
+        self.poll_all()
+        board = self.boards[2]
+        board.results = ["agreed", None]
+        state = self.tracker.boards[board.api]
+        self.tracker.update(state, board.board(), 0)
+        self.assertAlmostEqual(state.score, 0.5)
+        self.assertAlmostEqual(state.opponent_score, 0.5)
+        self.assertFalse(state.finished)
+        board.results = ["agreed", "agreed"]
+        self.tracker.update(state, board.board(), 0)
+        self.assertAlmostEqual(state.score, 1.0)
+        self.assertTrue(state.finished)
+        self.assertNotIn(state, self.tracker.due(10**10))
+        self.assert_recomputed()
+
+    def test_back_off_when_unchanged(self):
+        state = self.tracker.boards[self.boards[2].api]
+        self.tracker.update(state, self.boards[2].board(), 0)
+        self.assertEqual(state.next_poll, _MIN_BOARD_INTERVAL)
+        before = (self.tracker.score, self.tracker.projected)
+        self.tracker.update(state, None, 100)
+        self.assertEqual(state.interval, 2 * _MIN_BOARD_INTERVAL)
+        self.assertEqual(state.next_poll, 100 + 2 * _MIN_BOARD_INTERVAL)
+        for _ in range(20):
+            self.tracker.update(state, None, 100)
+        self.assertEqual(state.interval, _MAX_BOARD_INTERVAL)
+        self.assertEqual((self.tracker.score, self.tracker.projected), before)
+        # a change resets the interval
+        self.tracker.update(state, self.boards[2].board(), 200)
+        self.assertEqual(state.next_poll, 200 + _MIN_BOARD_INTERVAL)
+
+    def test_random_updates(self):
+        rng = random.Random(0)
+        ongoing = self.boards[2:]
+        self.poll_all()
+        for now in range(1, 200):
+            board = rng.choice(ongoing)
+            state = self.tracker.boards[board.api]
+            if state.finished:
+                continue
+            if rng.random() < 0.3:
+                self.tracker.update(state, None, now)
+            else:
+                side = rng.randrange(2)
+                if board.results[side] is None:
+                    board.results[side] = rng.choice(list(_POINTS))
+                self.tracker.update(state, board.board(), now)
+            self.assert_recomputed()
+        self.assertIsNone(self.tracker.next_poll)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,474 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import unittest
+from dataclasses import replace
+from typing import Optional
+from unittest import mock
+
+import requests
+from click.testing import CliRunner
+
+from src.commands.membership import (
+    _MATCH_POLL_INTERVAL,
+    _MAX_POLL_INTERVAL,
+    _MIN_POLL_INTERVAL,
+    _at_risk,
+    _compare_and_update,
+    _diff_members,
+    _due_watches,
+    _get_departure,
+    _resolve_player_ids,
+    _schedule_watch,
+    membership,
+)
+from src.utils.budget import BudgetExceeded
+from src.utils.external import external_diff
+from src.utils.functions import updated_members_data, updated_rollups_data
+from src.utils.indexes import ClubIndex
+from src.utils.journal import CLOSED, LEFT, UNKNOWN, RunJournal
+from src.utils.structures import (
+    Club,
+    Member,
+    MemberRecords,
+    MembershipRollups,
+    TimeoutWatch,
+    _OngoingGame,
+)
+
+CLUB_NAME = "test-club"
+NOW = 1_700_000_000
+
+# exact numbers of members affected by each kind of change in one run,
+# small enough to check every category of change. the benchmarks use
+# rates of churn of large clubs instead.
+CHANGE_COUNTS: dict[str, dict[str, int]] = {
+    "few_changes": {"left": 3, "closed": 1, "joined": 3, "renamed": 1},
+    "many_joins": {"left": 1, "joined": 20, "returned": 5, "reopened": 2},
+    "many_departures": {
+        "left": 25,
+        "closed": 8,
+        "renamed_gone": 4,
+        "joined": 1,
+    },
+    "many_renames": {
+        "renamed": 6,
+        "renamed_returned": 3,
+        "renamed_reopened": 3,
+        "renamed_gone": 2,
+    },
+}
+
+
+class _ChurnedClub:
+    """a mocked club with members on record, and the members, player ids
+    and clubs of departed members the api returns after `changes`"""
+
+    def __init__(self, changes: str, size: int = 200, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        counts = CHANGE_COUNTS[changes]
+        self.existing = [
+            Member(self._username(rng), 1000 + i, NOW - 86400 * (i + 1))
+            for i in range(size)
+        ] + [
+            Member(self._username(rng), 5000 + i, NOW - 86400 * i, False)
+            for i in range(size // 5)
+        ]
+        current = [replace(m) for m in self.existing if m.is_active]
+        former = [replace(m) for m in self.existing if not m.is_active]
+        rng.shuffle(current)
+        rng.shuffle(former)
+        self.departures: dict[int, str] = {}
+        self.player_ids: dict[str, int] = {}
+        incoming: list[Member] = []
+
+        def take(members: list[Member], kind: str) -> list[Member]:
+            taken = members[: counts.get(kind, 0)]
+            del members[: counts.get(kind, 0)]
+            return taken
+
+        for kind, outcome in (
+            ("left", LEFT),
+            ("closed", CLOSED),
+            ("renamed_gone", UNKNOWN),
+        ):
+            for member in take(current, kind):
+                self.departures[member.player_id or 0] = outcome
+        for member in take(current, "renamed"):
+            incoming.append(replace(member, username=self._username(rng)))
+        for member in take(current, "renamed_returned"):
+            incoming.append(
+                replace(member, username=self._username(rng), joined=NOW)
+            )
+        for member in take(former, "returned"):
+            incoming.append(replace(member, joined=NOW, is_active=True))
+        for member in take(former, "reopened"):
+            incoming.append(replace(member, is_active=True))
+        for member in take(former, "renamed_reopened"):
+            incoming.append(
+                replace(member, username=self._username(rng), is_active=True)
+            )
+        for i in range(counts.get("joined", 0)):
+            incoming.append(Member(self._username(rng), 9000 + i, NOW))
+        for member in incoming:
+            self.player_ids[member.username] = member.player_id or 0
+        # the api doesn't give player ids
+        self.incoming = [
+            replace(member, player_id=None) for member in current + incoming
+        ]
+        rng.shuffle(self.incoming)
+
+    @staticmethod
+    def _username(rng: random.Random) -> str:
+        return f"{rng.getrandbits(40):010x}"
+
+    def get_members(self, session: requests.Session) -> list[Member]:
+        return [replace(member) for member in self.incoming]
+
+    def iter_members(self, session: requests.Session):
+        return iter(self.get_members(session))
+
+    def update_player_id(self, member: Member, session: requests.Session):
+        member.player_id = self.player_ids[member.username]
+
+    def get_club_urls(self, member: Member, session: requests.Session):
+        outcome = self.departures[member.player_id or 0]
+        if outcome == UNKNOWN:
+            raise requests.exceptions.HTTPError("404")
+        if outcome == CLOSED:
+            return [f"https://www.chess.com/club/{CLUB_NAME}"]
+        return []
+
+
+def _sorted(members: list[Member]) -> list[tuple]:
+    return sorted((m.username, m.player_id, m.joined) for m in members)
+
+
+class TestExternalDiff(unittest.TestCase):
+    def test_same_as_in_memory_diff(self):
+        for changes in CHANGE_COUNTS:
+            with self.subTest(changes=changes):
+                churn = _ChurnedClub(changes)
+                existing = [m for m in churn.existing if m.is_active]
+                expected = _diff_members(existing, churn.incoming)
+                with tempfile.TemporaryDirectory() as dir:
+                    # several runs of each side are merged
+                    actual = external_diff(
+                        existing, churn.incoming, dir, run_size=16
+                    )
+                    self.assertGreater(len(os.listdir(dir)), 4)
+                for old, new in zip(expected, actual):
+                    self.assertEqual(_sorted(old), _sorted(new))
+
+    def test_empty_sides(self):
+        members = [Member("b", 2, 2), Member("a", 1, 1)]
+        with tempfile.TemporaryDirectory() as dir:
+            additions, deletions = external_diff([], members, dir)
+            self.assertEqual(_sorted(additions), _sorted(members))
+            self.assertEqual(deletions, [])
+            additions, deletions = external_diff(members, [], dir)
+            self.assertEqual(additions, [])
+            self.assertEqual(_sorted(deletions), _sorted(members))
+
+
+class TestLowMemoryCompare(unittest.TestCase):
+    def setUp(self):
+        # csv paths are relative to the working directory
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+
+    def _run(self, churn: _ChurnedClub, low_memory: bool, seeded: bool):
+        """output and files written by one run in an empty directory"""
+
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        os.chdir(dir.name)
+        updated_members_data(CLUB_NAME, MemberRecords(churn.existing))
+        if seeded:
+            rollups = MembershipRollups()
+            rollups.seed_cohorts(churn.existing)
+            updated_rollups_data(CLUB_NAME, rollups)
+        club = Club(f"https://api.chess.com/pub/club/{CLUB_NAME}")
+        stdout = io.StringIO()
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(
+                mock.patch.object(Club, "from_str", return_value=club)
+            )
+            for name in ("get_members", "iter_members"):
+                stack.enter_context(
+                    mock.patch.object(
+                        Club, name, side_effect=getattr(churn, name)
+                    )
+                )
+            for name in ("update_player_id", "get_club_urls"):
+                stack.enter_context(
+                    mock.patch.object(
+                        Member,
+                        name,
+                        autospec=True,
+                        side_effect=getattr(churn, name),
+                    )
+                )
+            stack.enter_context(
+                mock.patch(
+                    "src.commands.membership.time",
+                    **{"time.return_value": NOW},
+                )
+            )
+            stack.enter_context(contextlib.redirect_stdout(stdout))
+            active = _compare_and_update(
+                requests.Session(), CLUB_NAME, low_memory=low_memory
+            )
+        files: dict[str, str] = {}
+        dir = os.path.join("CSV_files", CLUB_NAME)
+        for name in sorted(os.listdir(dir)):
+            with open(os.path.join(dir, name)) as stream:
+                files[name] = stream.read()
+        return active, stdout.getvalue(), files
+
+    def test_same_as_in_memory_compare(self):
+        for changes in CHANGE_COUNTS:
+            for seeded in (False, True):
+                with self.subTest(changes=changes, seeded=seeded):
+                    churn = _ChurnedClub(changes)
+                    expected = self._run(churn, False, seeded)
+                    actual = self._run(churn, True, seeded)
+                    self.assertEqual(expected[0], actual[0])
+                    self.assertEqual(expected[1], actual[1])
+                    self.assertEqual(expected[2].keys(), actual[2].keys())
+                    for name in expected[2]:
+                        self.assertEqual(
+                            expected[2][name], actual[2][name], name
+                        )
+
+
+class TestGetDeparture(unittest.TestCase):
+    def setUp(self):
+        self.club = Club("https://api.chess.com/pub/club/a")
+        now = int(time.time())
+        self.member = Member("x", 1, now - 86400 * 30)
+        # yesterday's run listed x in both clubs
+        self.index = ClubIndex(2 * 86400)
+        self.index.update_club("a", ["x"], now - 86400)
+        self.index.update_club("b", ["x"], now - 86390)
+
+    def _departure(self, club_urls: list[str]) -> tuple[str, int]:
+        with mock.patch.object(
+            Member, "get_club_urls", return_value=club_urls
+        ) as get_club_urls:
+            outcome = _get_departure(
+                requests.Session(), self.club, self.member, None, self.index
+            )
+        return outcome, get_club_urls.call_count
+
+    def test_closure_after_other_clubs_list(self):
+        # x closed the account after b was fetched, so b's list can't tell
+        self.index.update_club("a", [])
+        self.assertEqual(self._departure([self.club.url]), (CLOSED, 1))
+
+    def test_listed_by_club_fetched_in_this_run(self):
+        self.index.update_club("b", ["x"])
+        self.index.update_club("a", [])
+        self.assertEqual(self._departure([]), (LEFT, 0))
+
+    def test_club_not_fetched_in_this_run(self):
+        self.assertEqual(self._departure([]), (LEFT, 1))
+
+
+class TestMembershipJournal(unittest.TestCase):
+    def setUp(self):
+        # configs and csv paths are relative to the working directory
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        dir = tempfile.TemporaryDirectory()
+        self.addCleanup(dir.cleanup)
+        os.chdir(dir.name)
+        os.mkdir("configs")
+        with open("configs/configs.yml", "w") as stream:
+            stream.write(
+                "club_configs:\n"
+                "  a:\n    recruitment: {}\n"
+                "  b:\n    recruitment: {}\n"
+            )
+        self.calls: list[tuple[str, bool, Optional[RunJournal]]] = []
+        self.interrupt: set[str] = set()
+
+    def _compare_and_update(
+        self, session, club_name, readonly, journal, index, low_memory
+    ) -> int:
+        self.calls.append((club_name, readonly, journal))
+        if club_name in self.interrupt:
+            raise BudgetExceeded("request budget used up")
+        if journal is not None:
+            journal.complete(club_name)
+        return 1
+
+    def _run(self, *args: str) -> str:
+        self.calls.clear()
+        with mock.patch(
+            "src.commands.membership._compare_and_update",
+            side_effect=self._compare_and_update,
+        ):
+            result = CliRunner().invoke(membership, list(args))
+        return result.output
+
+    def _journal(self) -> list[str]:
+        with open("CSV_files/journal.csv") as stream:
+            return stream.readlines()
+
+    def test_resume_skips_completed_clubs(self):
+        self.interrupt = {"b"}
+        self._run("-a")
+        self.assertEqual([call[0] for call in self.calls], ["a", "b"])
+        self.interrupt = set()
+        output = self._run("-a", "--resume")
+        self.assertIn("skipping a", output)
+        self.assertEqual([call[0] for call in self.calls], ["b"])
+        # a finished run leaves no journal behind
+        self.assertFalse(os.path.exists("CSV_files/journal.csv"))
+
+    def test_resume_needs_the_same_options(self):
+        self.interrupt = {"b"}
+        self._run("-a")
+        output = self._run("-c", "b", "--resume")
+        self.assertIn("needs the same options", output)
+        self.assertEqual(self.calls, [])
+        output = self._run("-a", "-r", "--resume")
+        self.assertIn("needs the same options", output)
+        self.assertEqual(self.calls, [])
+
+    def test_readonly_runs_leave_the_journal_alone(self):
+        self.interrupt = {"b"}
+        self._run("-a")
+        journal = self._journal()
+        self.interrupt = set()
+        self._run("-r", "-c", "a")
+        self._run("-r", "-a")
+        self.assertTrue(all(call[2] is None for call in self.calls))
+        self.assertEqual(self._journal(), journal)
+        self._run("-a", "--resume")
+        self.assertEqual([call[0] for call in self.calls], ["b"])
+
+    def test_journaled_player_ids_are_reused(self):
+        journal = RunJournal.start(["a"], False)
+        journal.add_player_id(Member("someone", 1, 100))
+        member = Member("someone", None, 100)
+        with mock.patch.object(Member, "update_player_id") as request:
+            _resolve_player_ids(
+                requests.Session(), [member], RunJournal.resume()
+            )
+        self.assertEqual(member.player_id, 1)
+        request.assert_not_called()
+
+    def test_journaled_departures_are_reused(self):
+        club = Club("https://api.chess.com/pub/club/a")
+        member = Member("someone", 1, 100)
+        RunJournal.start(["a"], False).add_departure("a", member, CLOSED)
+        with mock.patch.object(Member, "get_club_urls") as request:
+            outcome = _get_departure(
+                requests.Session(), club, member, RunJournal.resume()
+            )
+        self.assertEqual(outcome, CLOSED)
+        request.assert_not_called()
+
+
+MATCH = "https://api.chess.com/pub/match/1"
+
+
+def _game(move_by: int, to_move: bool = True, match: str = MATCH):
+    return _OngoingGame(
+        url=f"https://www.chess.com/game/daily/{move_by}",
+        turn="white" if to_move else "black",
+        white="https://api.chess.com/pub/player/someone",
+        black="https://api.chess.com/pub/player/opponent",
+        move_by=move_by,
+        match=match,
+    )
+
+
+class TestTimeoutScheduling(unittest.TestCase):
+    def setUp(self):
+        self.watch = TimeoutWatch("Someone")
+
+    def schedule(self, *games: _OngoingGame) -> None:
+        _schedule_watch(self.watch, list(games), {MATCH}, NOW)
+
+    def test_earliest_deadline(self):
+        self.schedule(_game(NOW + 20 * 3600), _game(NOW + 16 * 3600))
+        self.assertEqual(self.watch.deadline, NOW + 16 * 3600)
+        self.assertTrue(self.watch.game.endswith(str(NOW + 16 * 3600)))
+        # a quarter of the time left
+        self.assertEqual(self.watch.next_poll, NOW + 4 * 3600)
+
+    def test_interval_is_clamped(self):
+        self.schedule(_game(NOW + 600))
+        self.assertEqual(self.watch.next_poll, NOW + _MIN_POLL_INTERVAL)
+        self.schedule(_game(NOW + 10 * 86400))
+        self.assertEqual(self.watch.next_poll, NOW + _MATCH_POLL_INTERVAL)
+
+    def test_opponent_to_move(self):
+        self.schedule(_game(NOW + 3600, to_move=False))
+        self.assertEqual((self.watch.deadline, self.watch.game), (0, ""))
+        self.assertEqual(self.watch.next_poll, NOW + _MATCH_POLL_INTERVAL)
+
+    def test_on_vacation(self):
+        # games of players on vacation have no deadline
+        self.schedule(_game(0))
+        self.assertEqual(self.watch.deadline, 0)
+        self.assertEqual(self.watch.next_poll, NOW + _MATCH_POLL_INTERVAL)
+
+    def test_games_outside_club_matches(self):
+        self.schedule(
+            _game(NOW + 3600, match=None), _game(NOW + 60, match="x")
+        )
+        self.assertEqual(self.watch.deadline, 0)
+        self.assertEqual(self.watch.next_poll, NOW + _MAX_POLL_INTERVAL)
+
+    def test_deadline_is_cleared(self):
+        self.schedule(_game(NOW + 3600))
+        self.schedule()
+        self.assertEqual((self.watch.deadline, self.watch.game), (0, ""))
+        self.assertEqual(self.watch.next_poll, NOW + _MAX_POLL_INTERVAL)
+
+
+class TestTimeoutSelection(unittest.TestCase):
+    def setUp(self):
+        self.watches = [
+            TimeoutWatch("later", NOW - 10, NOW + 30 * 3600),
+            TimeoutWatch("soon", NOW - 10, NOW + 3600),
+            TimeoutWatch("passed", NOW + 3600, NOW - 60),
+            TimeoutWatch("not_due", NOW + 60, NOW + 7200),
+            TimeoutWatch("no_games", NOW - 100),
+            TimeoutWatch("new"),
+        ]
+
+    def names(self, watches: list[TimeoutWatch]) -> list[str]:
+        return [watch.username for watch in watches]
+
+    def test_due_soonest_deadline_first(self):
+        self.assertEqual(
+            self.names(_due_watches(self.watches, NOW)),
+            ["soon", "later", "new", "no_games"],
+        )
+
+    def test_due_all_members(self):
+        self.assertEqual(
+            len(_due_watches(self.watches, NOW, all_members=True)), 6
+        )
+
+    def test_at_risk_drops_passed_deadlines(self):
+        self.assertEqual(
+            self.names(_at_risk(self.watches, NOW, 24)), ["soon", "not_due"]
+        )
+        self.assertEqual(
+            self.names(_at_risk(self.watches, NOW, 48)),
+            ["soon", "not_due", "later"],
+        )
+        self.assertEqual(self.names(_at_risk(self.watches, NOW + 7200, 1)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()